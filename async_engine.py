@@ -0,0 +1,491 @@
+'''
+An asyncio engine core that plays many matches concurrently in one process.
+
+AsyncPlayer and AsyncGame follow Player and Game from engine.py step for step,
+but talk to the bots over non-blocking sockets, so one event loop can drive
+dozens of matches while their bots think. Each query is charged to the bot's
+game clock from the moment the message is written until its response line
+arrives, as in Player.query: the arrival is timed when the loop reads the
+bytes, not when the match's coroutine next runs, and the blocking work of a
+match (all-in EV, game log writes, the results database) runs in worker
+threads, so one match's work is not charged to the bots of the others. The
+short steps of every round stay on the loop, where they cost the other bots
+less than handing them to a thread would. In-process bots are not supported
+here: they would block the event loop.
+'''
+from contextlib import redirect_stdout
+from collections import deque
+import subprocess
+import argparse
+import tempfile
+import shutil
+import asyncio
+import socket
+import json
+import time
+import os
+
+import engine
+from engine import RoundState, CheckAction, FoldAction
+from match_spec import parse_assignments
+from tournament import ROOT, apply_overrides, make_match, summarize
+
+
+async def offload(function, *args):
+    '''
+    Runs blocking CPU or disk work in a worker thread and returns its result,
+    leaving the event loop free to time the other matches' bots.
+    '''
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+class BotProtocol(asyncio.Protocol):
+    '''
+    Splits a bot's responses into lines, each stamped with the perf_counter time
+    its last bytes were read, however long the reading coroutine takes to resume.
+
+    connected is a future given (transport, protocol) for the first connection;
+    later ones are closed.
+    '''
+
+    def __init__(self, connected):
+        self.connected = connected
+        self.transport = None
+        self.buffer = bytearray()
+        self.lines = deque()
+        self.closed = False
+        self.waiter = None
+
+    def connection_made(self, transport):
+        if self.connected.done():
+            transport.close()
+        else:
+            self.transport = transport
+            self.connected.set_result((transport, self))
+
+    def data_received(self, data):
+        arrival = time.perf_counter()
+        self.buffer += data
+        end = self.buffer.find(b'\n')
+        while end >= 0:
+            self.lines.append((bytes(self.buffer[:end + 1]), arrival))
+            del self.buffer[:end + 1]
+            end = self.buffer.find(b'\n')
+        self.wake()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        '''
+        Resumes a waiting readline.
+        '''
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def readline(self):
+        '''
+        Returns the next response line and the time it arrived, or b'' once the bot has disconnected.
+        '''
+        while not self.lines:
+            if self.closed:
+                return b'', time.perf_counter()
+            self.waiter = asyncio.get_running_loop().create_future()
+            await self.waiter
+        return self.lines.popleft()
+
+
+class AsyncPlayer(engine.Player):
+    '''
+    Handles subprocess and socket interactions with one player's pokerbot.
+
+    The coroutines are named after the Player methods they stand in for, with
+    _async appended, so the inherited synchronous methods keep their meaning.
+    '''
+
+    def __init__(self, name, path, log_path=None):
+        super().__init__(name, path, log_path)
+        self.transport = None
+        self.protocol = None
+        self.output_task = None
+
+    async def start_match_async(self):
+        '''
+        Builds and runs the pokerbot for its first match, and reuses or restarts it
+        for later ones, as Player.start_match does.
+        '''
+        if self.matches_played == 0:
+            start_time = time.perf_counter()
+            # builds are short-lived subprocess.run calls, so a worker thread is enough
+            await offload(self.build)
+            self.timings['build'] = time.perf_counter() - start_time
+            await self.run_async()
+        elif not self.warm():
+            await self.stop_async()
+            self.reset()
+            self.transport = self.protocol = self.bot_subprocess = None
+            await self.run_async()
+        else:
+            start_time = time.perf_counter()
+            await self.new_match_async()
+            self.timings['new_match'] = time.perf_counter() - start_time
+        self.matches_played += 1
+        self.watch_resources()
+
+    def response_timeout(self):
+        '''
+        Returns how long to wait for the bot, as Player.run sets its socket timeout.
+        '''
+        if self.path == r"./player_chatbot":
+            return engine.PLAYER_TIMEOUT
+        return engine.CONNECT_TIMEOUT
+
+    async def enqueue_output(self, stream):
+        '''
+        Collects the bot's output in large blocks until it exits.
+        '''
+        while True:
+            output = await stream.read(65536)
+            if not output:
+                break
+            if self.path == r"./player_chatbot":
+                print(output.decode("utf-8", "replace"), end='', flush=True)
+            else:
+                self.output.write(output)
+
+    async def spawn_async(self, arguments, pass_fds=()):
+        '''
+        Starts the pokerbot subprocess with the given connection arguments.
+        '''
+        start_time = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(*self.commands['run'], *arguments,
+                                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                    cwd=self.path, pass_fds=pass_fds)
+        self.timings['spawn'] = time.perf_counter() - start_time
+        self.bot_subprocess = proc
+        self.output_task = asyncio.ensure_future(self.enqueue_output(proc.stdout))
+
+    async def run_async(self):
+        '''
+        Runs the pokerbot and waits for it to connect, over the transport
+        commands.json selects, as Player.run does.
+        '''
+        if self.commands is not None and len(self.commands['run']) > 0:
+            transport = self.commands.get('transport', 'tcp')
+            loop = asyncio.get_running_loop()
+            connected = loop.create_future()
+            listen_dir = None
+            try:
+                if transport == 'socketpair':
+                    engine_socket, bot_socket = socket.socketpair()
+                    with bot_socket:
+                        await self.spawn_async(['--fd', str(bot_socket.fileno())], pass_fds=(bot_socket.fileno(),))
+                    self.transport, self.protocol = await loop.create_unix_connection(lambda: BotProtocol(connected),
+                                                                                      sock=engine_socket)
+                elif transport in ('tcp', 'unix'):
+                    if transport == 'unix':
+                        listen_dir = tempfile.mkdtemp(prefix='pokerbots')
+                        address = os.path.join(listen_dir, 'bot.sock')
+                        server = await loop.create_unix_server(lambda: BotProtocol(connected), address)
+                        arguments = ['--unix', address]
+                    else:
+                        server = await loop.create_server(lambda: BotProtocol(connected), '', 0, family=socket.AF_INET)
+                        arguments = [str(server.sockets[0].getsockname()[1])]
+                    try:
+                        await self.spawn_async(arguments)
+                        start_time = time.perf_counter()
+                        self.transport, self.protocol = await asyncio.wait_for(connected, engine.CONNECT_TIMEOUT)
+                        self.timings['connect'] = time.perf_counter() - start_time
+                    finally:
+                        server.close()
+                else:
+                    print(self.name, 'unknown transport', transport, '- check "transport" in commands.json')
+                    return
+                print(self.name, 'connected successfully')
+            except (TypeError, ValueError):
+                print(self.name, 'run command misformatted')
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to connect')
+            except OSError:
+                print(self.name, 'run failed - check "run" in commands.json')
+            finally:
+                if listen_dir is not None:
+                    shutil.rmtree(listen_dir, ignore_errors=True)
+
+    async def new_match_async(self):
+        '''
+        Tells a still connected pokerbot that a new match starts, and resets the
+        bankroll and game clock, without restarting the bot.
+        '''
+        self.reset()
+        if self.transport is not None:
+            try:
+                self.transport.write(b'N\n')
+                ack, _ = await asyncio.wait_for(self.protocol.readline(), self.response_timeout())
+                if ack.strip() != b'K':
+                    print(self.name, 'did not acknowledge the new match')
+                    self.game_clock = 0.
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to start a new match')
+                self.game_clock = 0.
+            except OSError:
+                print(self.name, 'disconnected')
+                self.game_clock = 0.
+
+    async def stop_async(self):
+        '''
+        Closes the socket connection and stops the pokerbot.
+        '''
+        start_time = time.perf_counter()
+        if self.transport is not None:
+            try:
+                self.transport.write(b'Q\n')
+                self.transport.close()
+            except OSError:
+                print('Could not close socket connection with', self.name)
+        if self.bot_subprocess is not None:
+            try:
+                await asyncio.wait_for(self.bot_subprocess.wait(), self.response_timeout())
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to quit')
+                self.bot_subprocess.kill()
+                await self.bot_subprocess.wait()
+        if self.output_task is not None:
+            try:
+                await asyncio.wait_for(self.output_task, engine.CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.output_task.cancel()
+        self.timings['teardown'] = time.perf_counter() - start_time
+        await offload(self.write_log)
+
+    async def query_async(self, round_state, player_message, game_log):
+        '''
+        Requests one action from the pokerbot over the socket connection.
+
+        Follows Player.query: the game clock is charged for the time between
+        writing the message and the arrival of the response, but not for the
+        chatbot, which waits up to PLAYER_TIMEOUT for its human instead, and
+        timeouts, disconnections and misformatted or illegal responses are handled alike.
+        '''
+        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else {CheckAction}
+        if self.transport is not None and self.game_clock > 0.:
+            clause = ''
+            try:
+                # joined, since the transport may keep what it cannot send yet
+                message = b''.join(player_message.render(self.game_clock))
+                player_message.clear()  # do not send redundant action history
+                start_time = time.perf_counter()
+                self.transport.write(message)
+                line, end_time = await asyncio.wait_for(self.protocol.readline(), self.response_timeout())
+                clause = line.decode().strip()
+                if self.latency is not None:
+                    self.latency.record(getattr(round_state, 'street', None), clause, end_time - start_time)
+                if engine.ENFORCE_GAME_CLOCK and self.path != r"./player_chatbot":
+                    self.game_clock -= end_time - start_time
+                if self.game_clock <= 0.:
+                    raise asyncio.TimeoutError
+                action = self.decode_action(clause, round_state, legal_actions, game_log)
+                if action is not None:
+                    return action
+            except asyncio.TimeoutError:
+                error_message = self.name + ' ran out of time'
+                game_log.append(error_message)
+                print(error_message)
+                self.game_clock = 0.
+            except OSError:
+                error_message = self.name + ' disconnected'
+                game_log.append(error_message)
+                print(error_message)
+                self.game_clock = 0.
+            except (IndexError, KeyError, ValueError):
+                game_log.append(self.name + ' response misformatted: ' + str(clause))
+        return CheckAction() if CheckAction in legal_actions else FoldAction()
+
+
+class AsyncGame(engine.Game):
+    '''
+    Runs one game of poker with AsyncPlayers on the running event loop.
+
+    As with AsyncPlayer, the coroutines carry an _async suffix.
+    '''
+
+    async def run_round_async(self, players, bounties, round_num):
+        '''
+        Runs one round of poker.
+        '''
+        hands, deck = self.schedule.deal(round_num)
+        pips = [engine.SMALL_BLIND, engine.BIG_BLIND]
+        stacks = [engine.STARTING_STACK - engine.SMALL_BLIND, engine.STARTING_STACK - engine.BIG_BLIND]
+        round_state = RoundState(0, 0, pips, stacks, hands, deck, bounties)
+        terminal_state = None
+        while terminal_state is None:
+            self.log_round_state(players, round_state)
+            active = round_state.button % 2
+            player = players[active]
+            action = await player.query_async(round_state, self.player_messages[active], self.log)
+            bet_override = (round_state.pips == [0, 0])
+            self.log_action(player.name, action, bet_override)
+            if engine.ALL_IN_EV and 0 in round_state.stacks:
+                # the showdown of an all-in may enumerate its runouts for all_in_ev
+                terminal_state = await offload(round_state.apply, action)
+            else:
+                terminal_state = round_state.apply(action)
+        self.log_terminal_state(players, terminal_state)
+        await self.send_round_over_async(players, terminal_state)
+        for player, delta, ev_delta in zip(players, terminal_state.deltas, terminal_state.ev_deltas):
+            player.bankroll += delta
+            player.ev_bankroll += ev_delta
+        self.record_round(round_num, hands, deck, bounties, terminal_state)
+        return terminal_state
+
+    async def send_round_over_async(self, players, terminal_state, deferred=False):
+        '''
+        Sends the players the results of a round, and waits for them to acknowledge
+        them, as Game.send_round_over does.
+        '''
+        queries = [player.query_async(terminal_state, player_message, self.log)
+                   for player, player_message in zip(players, self.player_messages)
+                   if deferred == (engine.DEFER_ROUND_OVER and player.defers_round_over)]
+        await asyncio.gather(*queries)
+
+    async def run_async(self, players, keep_alive=False, resume=None):
+        '''
+        Runs one game of poker, as Game.run does, checkpointing it with
+        CHECKPOINT_FILENAME and continuing it from the checkpoint resume.
+        '''
+        # deals the schedule and opens the hand history
+        players = await offload(self.start, players, resume)
+        bounties = [-1, -1]
+        first_round = 1
+        if resume is not None:
+            players, bounties, first_round = await offload(self.restore, players, resume)
+        start_time = time.perf_counter()
+        await asyncio.gather(*[player.start_match_async() for player in players])
+        self.timings['setup'] = time.perf_counter() - start_time
+        for round_num in range(first_round, engine.NUM_ROUNDS + 1):
+            bounties = self.start_round(players, bounties, round_num)
+            terminal_state = await self.run_round_async(players, bounties, round_num)
+            if self.log.flush_due():
+                await offload(self.end_round, players)
+            else:
+                self.end_round(players)
+
+            players = players[::-1]
+            bounties = bounties[::-1]
+            self.player_messages.reverse()
+            if (engine.CHECKPOINT_FILENAME is not None and round_num % engine.CHECKPOINT_ROUNDS == 0
+                    and round_num < engine.NUM_ROUNDS):
+                await offload(self.checkpoint, players, bounties, round_num + 1)
+        if engine.DEFER_ROUND_OVER and engine.NUM_ROUNDS > 0:
+            await self.send_round_over_async(players, terminal_state, deferred=True)
+        self.log.append('')
+        self.log.append('Final' + engine.STATUS(players) +
+                        (' | All-in EV' + engine.EV_STATUS(players) if engine.ALL_IN_EV else ''))
+        start_time = time.perf_counter()
+        if keep_alive:
+            for player in players:
+                await offload(player.write_log)
+        else:
+            await asyncio.gather(*[player.stop_async() for player in players])
+        self.timings['teardown'] = time.perf_counter() - start_time
+        return await offload(self.finish, players)
+
+
+def load_checkpoint(workdir):
+    '''
+    Returns the checkpoint a match left in workdir, or None if it left none.
+    '''
+    if engine.CHECKPOINT_FILENAME is None:
+        return None
+    path = os.path.join(workdir, engine.CHECKPOINT_FILENAME + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+async def play_match(spec, output_dir, semaphore):
+    '''
+    Plays one match spec inside output_dir/match_id and returns its result dict.
+    '''
+    async with semaphore:
+        workdir = os.path.join(output_dir, spec['match_id'])
+        os.makedirs(workdir, exist_ok=True)
+        result = {'match_id': spec['match_id'], 'workdir': workdir, 'overrides': spec['overrides'],
+                  'seed': spec['seed'], 'pair': spec['pair'], 'bankrolls': None, 'ev_bankrolls': None,
+                  'timings': None, 'resources': None, 'error': None}
+        start_time = time.perf_counter()
+        try:
+            players = [AsyncPlayer(name, os.path.join(ROOT, path), os.path.join(workdir, name + '.txt'))
+                       for name, path in spec['players']]
+            # a match interrupted in this directory is continued from its checkpoint
+            resume = await offload(load_checkpoint, workdir)
+            seed = spec['seed'] if resume is None else resume['seed']
+            result['seed'] = seed
+            game = AsyncGame(seed, output_dir=workdir, match_id=spec['match_id'])
+            result['bankrolls'] = await game.run_async(players, resume=resume)
+            result['ev_bankrolls'] = game.ev_bankrolls
+            result['timings'] = game.timings
+            result['resources'] = game.resources
+        except Exception as error:  # pylint: disable=broad-except
+            result['error'] = repr(error)
+        result['duration'] = time.perf_counter() - start_time
+        return result
+
+
+def run_matches(matches, output_dir='async_matches', concurrency=None, overrides=None):
+    '''
+    Plays match specs concurrently on one event loop and returns (results, summary).
+
+    Config overrides are process-wide here, so they are given once for all matches
+    rather than per spec. concurrency caps the matches in flight, defaulting to all.
+    '''
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    apply_overrides(overrides or {})
+
+    async def play_all():
+        semaphore = asyncio.Semaphore(concurrency or len(matches) or 1)
+        return await asyncio.gather(*[play_match(spec, output_dir, semaphore) for spec in matches])
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(play_all())
+    finally:
+        loop.close()
+    summary = summarize(results)
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as summary_file:
+        json.dump({'summary': summary, 'results': results}, summary_file, indent=4)
+    return results, summary
+
+
+def parse_args():
+    '''
+    Parses command line arguments.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 async_engine.py')
+    parser.add_argument('--matches', type=int, default=16, help='Number of matches to play')
+    parser.add_argument('--concurrency', type=int, default=None, help='Matches in flight at once, defaults to all')
+    parser.add_argument('--output', type=str, default='async_matches', help='Directory for per-match output')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override a config.py parameter for every match')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Plays the matches given on the command line and prints their summary.
+
+    With CHECKPOINT_FILENAME set, rerunning with the same --output continues
+    the matches that were interrupted from their checkpoints.
+    '''
+    args = parse_args()
+    overrides = parse_assignments(args.set)
+    specs = [make_match('match_{:05d}'.format(i), overrides=overrides) for i in range(args.matches)]
+    with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+        _, summary = run_matches(specs, args.output, args.concurrency, overrides)
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == '__main__':
+    main()
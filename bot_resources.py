@@ -0,0 +1,148 @@
+'''
+Resource accounting for bot subprocesses, read from /proc (Linux only).
+
+Every few rounds and after the last one, the bot's process and its descendants
+(a run.sh wrapper's bot, say) are sampled for CPU time, resident memory, page faults and context
+switches, so a bot that is slow can be told apart as computing, paging or
+waiting for a core on a loaded machine. Context switches are summed over the
+threads alive when sampled; CPU time also counts threads that have exited.
+'''
+import os
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):  # not a Unix
+    CLOCK_TICKS = PAGE_SIZE = None
+# fields of /proc/PID/stat counted from the one after the command name
+MINOR_FAULTS, MAJOR_FAULTS, USER_TICKS, SYSTEM_TICKS, RSS_PAGES = 7, 9, 11, 12, 21
+# fields of /proc/PID/task/TID/status read for every thread
+STATUS_FIELDS = (b'VmHWM', b'voluntary_ctxt_switches', b'nonvoluntary_ctxt_switches')
+
+
+def _read(path):
+    '''
+    Returns the contents of a /proc file, read in one call.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, 65536)
+    finally:
+        os.close(fd)
+
+
+def _status_fields(text, names):
+    '''
+    Returns the integer values of the named fields of a /proc status file.
+    '''
+    values = dict.fromkeys(names, 0)
+    for line in text.splitlines():
+        name, _, value = line.partition(b':')
+        if name in values:
+            values[name] = int(value.split()[0])
+    return values
+
+
+def sample(pid):
+    '''
+    Returns the resource usage of pid and its descendants, or None if pid has exited or /proc is missing.
+    '''
+    usage = {'user_seconds': 0., 'system_seconds': 0., 'rss': 0, 'peak_rss': 0, 'minor_faults': 0,
+             'major_faults': 0, 'voluntary_switches': 0, 'involuntary_switches': 0}
+    pids = [pid]
+    found = False
+    while pids:
+        pid = pids.pop()
+        try:
+            fields = _read('/proc/{}/stat'.format(pid)).rpartition(b')')[2].split()
+            tids = os.listdir('/proc/{}/task'.format(pid))
+        except OSError:
+            continue  # exited since its parent was read
+        found = True
+        usage['user_seconds'] += int(fields[USER_TICKS]) / CLOCK_TICKS
+        usage['system_seconds'] += int(fields[SYSTEM_TICKS]) / CLOCK_TICKS
+        usage['rss'] += int(fields[RSS_PAGES]) * PAGE_SIZE
+        usage['minor_faults'] += int(fields[MINOR_FAULTS])
+        usage['major_faults'] += int(fields[MAJOR_FAULTS])
+        for tid in tids:
+            task = '/proc/{}/task/{}/'.format(pid, tid)
+            try:
+                status = _status_fields(_read(task + 'status'), STATUS_FIELDS)
+            except OSError:
+                continue  # the thread exited
+            # every thread's status shows the memory of the whole process
+            if tid == str(pid):
+                usage['peak_rss'] += status[b'VmHWM'] * 1024
+            usage['voluntary_switches'] += status[b'voluntary_ctxt_switches']
+            usage['involuntary_switches'] += status[b'nonvoluntary_ctxt_switches']
+            try:
+                # missing on kernels without CONFIG_PROC_CHILDREN, where only the bot itself is sampled
+                pids.extend(int(child) for child in _read(task + 'children').split())
+            except OSError:
+                pass
+    return usage if found else None
+
+
+class ResourceRecorder():
+    '''
+    Collects one bot's resource usage over a match, from the moment it is created,
+    in intervals of the rounds between samples.
+
+    pid is the process id of the bot subprocess.
+    '''
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.start = sample(pid) if CLOCK_TICKS is not None else None
+        self.last = self.start
+        self.round_nums = []
+        self.cpu_seconds = []
+        self.rss = []
+        self.involuntary_switches = []
+
+    def record(self, round_num):
+        '''
+        Samples the bot after round_num and records its usage since the last sample.
+        '''
+        if self.last is None:
+            return
+        usage = sample(self.pid)
+        if usage is None:
+            return
+        self.round_nums.append(round_num)
+        self.cpu_seconds.append(usage['user_seconds'] + usage['system_seconds'] -
+                                self.last['user_seconds'] - self.last['system_seconds'])
+        self.rss.append(usage['rss'])
+        # threads that exited take their switches with them
+        self.involuntary_switches.append(max(usage['involuntary_switches'] - self.last['involuntary_switches'], 0))
+        self.last = usage
+
+    def summary(self, clock_used):
+        '''
+        Returns the match's totals beside clock_used, the game clock the bot used,
+        or None if the bot could not be sampled.
+
+        peak_rss is the bot's peak since it started, so it spans earlier matches of a warm bot.
+        '''
+        if self.start is None:
+            return None
+        return {
+            'clock_used': clock_used,
+            'cpu_seconds': self.last['user_seconds'] + self.last['system_seconds'] -
+                           self.start['user_seconds'] - self.start['system_seconds'],
+            'user_seconds': self.last['user_seconds'] - self.start['user_seconds'],
+            'system_seconds': self.last['system_seconds'] - self.start['system_seconds'],
+            'peak_rss': self.last['peak_rss'],
+            'minor_faults': self.last['minor_faults'] - self.start['minor_faults'],
+            'major_faults': self.last['major_faults'] - self.start['major_faults'],
+            'voluntary_switches': self.last['voluntary_switches'] - self.start['voluntary_switches'],
+            'involuntary_switches': self.last['involuntary_switches'] - self.start['involuntary_switches'],
+        }
+
+    def rounds(self):
+        '''
+        Returns the rounds sampled after, and the CPU seconds, resident bytes and
+        involuntary context switches of the interval each one ends.
+        '''
+        return {'round_num': self.round_nums, 'cpu_seconds': self.cpu_seconds, 'rss': self.rss,
+                'involuntary_switches': self.involuntary_switches}
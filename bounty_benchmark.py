@@ -0,0 +1,67 @@
+'''
+Micro-benchmark of the per-round cost of bounty evaluation.
+
+Replays the deals of a schedule through every street of a round, checking the
+bounties once per street and once more at showdown, where get_delta and showdown
+each ask for them. The list-scanning evaluation the engine used to run is kept
+here as the baseline for the rank masks RoundState now keeps.
+
+usage: python3 bounty_benchmark.py [NUM_ROUNDS]
+'''
+import time
+import sys
+
+from deal_schedule import DealSchedule
+from engine import RoundState, SMALL_BLIND, BIG_BLIND, STARTING_STACK
+
+STREETS = (0, 3, 4, 5)
+
+
+def list_bounty_hits(hands, deck, bounties, street):
+    '''
+    The former RoundState.get_bounty_hits: builds both players' card lists and scans their rank names.
+    '''
+    cards0 = hands[0] + ([] if street == 0 else deck.peek(street))
+    cards1 = hands[1] + ([] if street == 0 else deck.peek(street))
+    cardNames = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
+    return (bounties[0] in [cardNames[card.rank] for card in cards0],
+            bounties[1] in [cardNames[card.rank] for card in cards1])
+
+
+def time_lists(deals):
+    '''
+    Times list-scanning bounty checks for every round, at every street.
+    '''
+    start_time = time.perf_counter()
+    for hands, deck, bounties in deals:
+        for street in STREETS:
+            list_bounty_hits(hands, deck, bounties, street)
+        list_bounty_hits(hands, deck, bounties, 5)
+    return time.perf_counter() - start_time
+
+
+def time_masks(deals):
+    '''
+    Times rank-mask bounty checks for every round, at every street. This includes
+    building each RoundState, masks and all, and extending the masks on each street,
+    so it overstates the cost of the checks themselves.
+    '''
+    start_time = time.perf_counter()
+    for hands, deck, bounties in deals:
+        round_state = RoundState(0, 0, [SMALL_BLIND, BIG_BLIND],
+                                 [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND], hands, deck, bounties)
+        round_state.get_bounty_hits()
+        for _ in STREETS[1:]:
+            round_state.proceed_street()
+            round_state.get_bounty_hits()
+        round_state.get_bounty_hits()
+    return time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    num_rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    schedule = DealSchedule.generate(0, num_rounds)
+    deals = [schedule.deal(round_num) + (schedule.bounties(round_num),) for round_num in range(1, num_rounds + 1)]
+    for name, timer in (('lists', time_lists), ('rank masks', time_masks)):
+        seconds = timer(deals)
+        print('{:>10}: {:.3f} us per round'.format(name, seconds / num_rounds * 1e6))
@@ -1,73 +1,202 @@
-import math
 from alive_progress import alive_bar
 
-import subprocess
-import time
-import re
+import argparse
 import json
+import math
+import os
+
+from hand_history import HandHistory
+from tournament import make_duplicate, make_match, run_tournament
+
+# every compare match writes a hand history under this name, for its per-round deltas
+HAND_HISTORY = 'hands'
+# the challenger and the bot it is compared with
+PLAYERS = [('New', 'best_bot'), ('Best', 'best_bot')]
+
+
+class SequentialTest():
+    """
+    Two one-sided sequential probability ratio tests on the challenger's mean delta per round.
+
+    One weighs a challenger that wins `margin` chips per round against an even
+    one, the other a challenger that loses `margin` chips per round against an
+    even one. Per-round deltas are treated as independent and normal with the
+    variance seen so far. Rounds can be added as they arrive and the test stopped
+    as soon as it decides 'better', 'worse', or 'even' (neither is ahead by the
+    margin), with error rates alpha (calling an even challenger better or worse)
+    and beta (calling a challenger that is ahead or behind by the margin even).
+    """
+
+    def __init__(self, margin, alpha=0.05, beta=0.05, min_rounds=1000):
+        self.margin = margin
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.min_rounds = min_rounds
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.decision = None
+
+    def add(self, delta):
+        """
+        Adds one round's delta, updating the running mean and variance.
+        """
+        self.count += 1
+        difference = delta - self.mean
+        self.mean += difference / self.count
+        self.m2 += difference * (delta - self.mean)
+
+    def variance(self):
+        """
+        Returns the sample variance of the deltas so far.
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.
+
+    def llr(self, edge):
+        """
+        Returns the log-likelihood ratio of a mean delta of edge to a mean delta of 0.
+        """
+        variance = self.variance()
+        return edge * self.count * (self.mean - edge / 2) / variance if variance > 0 else 0.
+
+    def update(self):
+        """
+        Decides once either ratio crosses its upper bound, or both cross their
+        lower bounds, and returns the decision.
+        """
+        if self.decision is None and self.count >= self.min_rounds:
+            better, worse = self.llr(self.margin), self.llr(-self.margin)
+            if better >= self.upper:
+                self.decision = 'better'
+            elif worse >= self.upper:
+                self.decision = 'worse'
+            elif better <= self.lower and worse <= self.lower:
+                self.decision = 'even'
+        return self.decision
+
+    def interval(self, z=1.96):
+        """
+        Returns a normal confidence interval on the mean delta per round.
+        """
+        stderr = math.sqrt(self.variance() / self.count) if self.count else 0.
+        return self.mean - z * stderr, self.mean + z * stderr
 
+    def report(self):
+        """
+        Returns the decision, the number of rounds, the mean and its 95% interval, and the ratios with their bounds.
+        """
+        return {
+            'decision': self.decision or 'inconclusive',
+            'rounds': self.count,
+            'mean': self.mean,
+            'interval': list(self.interval()),
+            'llr': {'better': self.llr(self.margin), 'worse': self.llr(-self.margin)},
+            'bounds': [self.lower, self.upper],
+        }
 
-def run_program_thousand_times(program_path, delay=0.0):
+
+def round_deltas(result, name):
+    """
+    Reads one player's per-round deltas from the hand history of a finished match.
+    """
+    history = HandHistory(os.path.join(result['workdir'], HAND_HISTORY))
+    try:
+        index = history.player_names.index(name)
+        return [deltas[index] for deltas in history.deltas()]
+    finally:
+        history.close()
+
+
+def run_program_thousand_times(iterations=25, processes=None, duplicate=False, margin=2., alpha=0.05, beta=0.05,
+                               cores_per_match=None):
+    """
+    Plays up to `iterations` matches of the PLAYERS in parallel, stopping
+    as soon as a sequential test decides whether New is better, worse or even with Best.
+
+    Args:
+        iterations (int): Most matches to play.
+        processes (int): Matches run at once, defaults to the core count.
+        duplicate (bool): Play each match twice with the same cards and the
+            seats swapped; the paired deltas are printed at the end, and the test
+            uses the mean of New's two deltas for each round's cards.
+        margin (float): The edge in chips per round, either way, the test tells
+            apart from an even match.
+        alpha, beta (float): The test's error rates, see SequentialTest.
+        cores_per_match (int): Pin every match to its own set of this many cores,
+            see run_tournament, so that loaded runs charge the same clock.
+    """
     new = 0
     best = 0
     wins = {'new':0, 'best':0}
     scores = {'new':[], 'best':[]}
+    overrides = {'HAND_HISTORY_FILENAME': HAND_HISTORY}
+    if duplicate:
+        specs = [spec for i in range(iterations)
+                 for spec in make_duplicate('compare_{:05d}'.format(i), PLAYERS, overrides)]
+    else:
+        specs = [make_match('compare_{:05d}'.format(i), PLAYERS, overrides) for i in range(iterations)]
+    test = SequentialTest(margin, alpha, beta)
+    halves = {}
+    with alive_bar(len(specs)) as bar:
+        def record(result):
+            bar()
+            if result['error'] is not None:
+                print(f"An error occurred in {result['match_id']}: {result['error']}")
+                return
+            if test.decision is not None:
+                return  # matches still running when the test decided do not change it
+            deltas = round_deltas(result, 'New')
+            if duplicate:
+                other_half = halves.pop(result['pair'], None)
+                if other_half is None:
+                    halves[result['pair']] = deltas
+                    return
+                deltas = [(delta + other_delta) / 2 for delta, other_delta in zip(deltas, other_half)]
+            for delta in deltas:
+                test.add(delta)
+            test.update()
+        results, summary = run_tournament(specs, 'compare', processes, callback=record,
+                                          stop=lambda: test.decision is not None, cores_per_match=cores_per_match)
+    if duplicate:
+        print(json.dumps(summary['duplicate'], indent=4))
+
+    for result in results:
+        if result['bankrolls'] is None:
+            continue
+        bankrolls = dict(result['bankrolls'])
+        new_score, best_score = bankrolls['New'], bankrolls['Best']
+        if new_score > best_score:
+            wins['new'] += 1
+        elif new_score < best_score:
+            wins['best'] += 1
+        new += new_score
+        best += best_score
+        scores['new'].append(new_score)
+        scores['best'].append(best_score)
+    return new, best, scores, wins, test.report()
+
+
+def parse_args():
     """
-    Runs a program 1000 times.
-    
-    Args:
-        program_path (str): Path to the program or script to execute.
-        delay (float): Optional delay (in seconds) between executions.
+    Parses compare command line arguments.
     """
-    iterations = 25 
-    with alive_bar(iterations) as bar:
-        for i in range(1, iterations):
-            try:
-                # print(f"Running iteration {i}...")
-                result = subprocess.run(["python", 'engine.py'], capture_output=True, text=True)
-                # result = subprocess.run(["python", 'engine_best.py'], capture_output=True, text=True)
-                # print(f"Iteration {i} completed. Output:\n{result.stdout}")
-                if result.stderr:
-                    print(f"Errors in iteration {i}:\n{result.stderr}")
-                if delay > 0:
-                    time.sleep(delay)
-            except Exception as e:
-                print(f"An error occurred on iteration {i}: {e}")
-                break
-
-            # result = list(subprocess.run(["cat", 'gamelog.txt'], capture_output=True, text=True))
-            # print(result[-1])
-            with open('gamelog.txt', "r") as file:
-                last_line = None
-                for line in file:
-                    last_line = line
-
-            # print(last_line) 
-            match = list(re.findall(r'\(([^()]*)\)', last_line))
-            if(int(match[0]) > int(match[1])):
-                wins['new'] += 1
-            elif(int(match[0]) < int(match[1])):
-                wins['best'] += 1
-            new += int(match[0])
-            best += int(match[1])
-            scores['new'].append(int(match[0]))
-            scores['best'].append(int(match[1]))
-            # print(new, best)
-            # print(match)
-            bar()
-    return new, best,scores,wins
+    parser = argparse.ArgumentParser(prog='python3 compare.py')
+    parser.add_argument('--matches', type=int, default=25, help='Most matches to play')
+    parser.add_argument('--processes', type=int, default=None, help='Matches run at once, defaults to the core count')
+    parser.add_argument('--duplicate', action='store_true',
+                        help='Play every match twice with the same cards and the seats swapped')
+    parser.add_argument('--margin', type=float, default=2., help='Edge in chips per round the test resolves')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Chance of calling an even New better or worse')
+    parser.add_argument('--beta', type=float, default=0.05, help='Chance of calling New even when it is a margin ahead or behind')
+    parser.add_argument('--pin', type=int, default=None, metavar='CORES',
+                        help='Pin every match to its own CORES cores, running at most as many at once as fit')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    # Provide the path to the program you want to run
-    program_to_run = "engine_new.py"  # Replace with the actual program file
-    # delay_between_runs = 0.1  # Optional: add a small delay (e.g., 0.1 seconds)
-    score = {'new':[],'best':[]}
-    for i in range(1):
-        new,best,scores,wins = run_program_thousand_times(program_to_run)
-        # score['new'].append(new)
-        # score['best'].append(best)
-        print(json.dumps(scores,indent=4))
-        print(json.dumps(wins,indent=4))
-        print(new,best)
-
-    # print(scores)
+    args = parse_args()
+    new,best,scores,wins,test = run_program_thousand_times(args.matches, args.processes, args.duplicate,
+                                                           args.margin, args.alpha, args.beta, args.pin)
+    print(json.dumps(scores,indent=4))
+    print(json.dumps(wins,indent=4))
+    print(json.dumps(test,indent=4))
+    print(new,best)
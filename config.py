@@ -7,13 +7,46 @@ PLAYER_2_NAME = "B"
 PLAYER_2_PATH = "./python_skeleton"  # Change this to './player_chatbot' to interact with your own bot!
 # GAME PROGRESS IS RECORDED HERE
 GAME_LOG_FILENAME = "gamelog"
-# PLAYER_LOG_SIZE_LIMIT IS IN BYTES
+# 'full' LOGS EVERY ACTION, 'results' ONLY ROUND HEADERS, BOUNTIES AND AWARDS
+GAME_LOG_LEVEL = 'full'
+# None, 'gzip' OR 'lzma'
+GAME_LOG_COMPRESSION = None
+GAME_LOG_FLUSH_ROUNDS = 100
+# ALSO RECORD A BINARY HAND HISTORY (.hh) AND ITS ROUND INDEX (.hhi) UNDER THIS NAME
+# NONE TO DISABLE, READ IT WITH hand_history.HandHistory
+HAND_HISTORY_FILENAME = None
+# PER-QUERY LATENCY PERCENTILES AND THE CLOCK LEFT PER ROUND ARE WRITTEN HERE (.json)
+# NONE TO DISABLE, WHICH ALSO SKIPS RECORDING THEM
+LATENCY_FILENAME = None
+# EVERY MATCH AND ITS ROUNDS ARE ADDED TO THIS SQLITE DATABASE AS IT PLAYS, KEPT ACROSS RUNS
+# NONE TO DISABLE, QUERY IT WITH results_db.py
+RESULTS_DATABASE = None
+# EVERY CHECKPOINT_ROUNDS ROUNDS THE MATCH IS SAVED TO THIS FILE (.json), REPLACED ATOMICALLY
+# python3 engine.py --resume [PATH] RESTARTS BOTH BOTS AND CONTINUES FROM IT, NONE TO DISABLE
+CHECKPOINT_FILENAME = None
+CHECKPOINT_ROUNDS = 1000
+# EVERY MATCH SENDS LIVE EVENTS AS JSON LINES TO THIS UNIX DATAGRAM SOCKET OR FIFO, NEVER WAITING:
+# EVENTS ARE DROPPED WHILE NOTHING READS THEM. NONE TO DISABLE, WATCH IT WITH python3 event_feed.py PATH
+EVENT_FEED = None
+# SAMPLE EACH BOT'S CPU TIME, MEMORY AND CONTEXT SWITCHES FROM /proc EVERY BOT_RESOURCES_ROUNDS
+# ROUNDS AND AFTER THE LAST ONE (LINUX ONLY). THEY ARE REPORTED BESIDE THE GAME CLOCK USED
+# IN THE LATENCY FILE AND TOURNAMENT RESULTS
+BOT_RESOURCES = False
+BOT_RESOURCES_ROUNDS = 100
+# PLAYER_LOG_SIZE_LIMIT IS IN BYTES, THE FIRST AND THE LAST HALF OF A BOT'S OUTPUT ARE KEPT
 PLAYER_LOG_SIZE_LIMIT = 524288
 # STARTING_GAME_CLOCK AND TIMEOUTS ARE IN SECONDS
 ENFORCE_GAME_CLOCK = True
 STARTING_GAME_CLOCK = 60.0
 BUILD_TIMEOUT = 10.0
 CONNECT_TIMEOUT = 10.0
+# IMPORT BOTS AND CALL THEM DIRECTLY INSTEAD OF USING SUBPROCESSES AND SOCKETS
+# ONLY FOR TRAINING AND TESTING - BOTS SHARE THE ENGINE PROCESS AND ITS CLOCK
+IN_PROCESS_BOTS = False
+# SEND THE RESULTS OF A ROUND AHEAD OF THE NEXT ROUND'S FIRST MESSAGE INSTEAD OF WAITING
+# FOR BOTH BOTS TO ACKNOWLEDGE THEM AT THE END OF EVERY ROUND
+# THE SKELETONS CALL handle_round_over BEFORE handle_new_round EITHER WAY
+DEFER_ROUND_OVER = False
 # THE GAME VARIANT FIXES THE PARAMETERS BELOW
 # CHANGE ONLY FOR TRAINING OR EXPERIMENTATION
 NUM_ROUNDS = 1000
@@ -27,3 +60,18 @@ BOUNTY_RATIO = 1.5  # subject to change, ratio as a multiplier of pot
 BOUNTY_CONSTANT = 10
 
 PLAYER_TIMEOUT = 120
+
+# SCORE ALL-IN SHOWDOWNS BY THEIR EV OVER THE RUNOUTS LEFT, BESIDE THE ACTUAL DELTAS
+# IT COSTS ABOUT 3 MS PER FLOP ALL-IN AND 13 MS PER PREFLOP ALL-IN WITH 2000 SAMPLES, SO IT IS OFF
+# BY DEFAULT; OFF, THE EV BANKROLLS EQUAL THE ACTUAL ONES
+ALL_IN_EV = False
+# PREFLOP ALL-IN EV AVERAGES THIS MANY SAMPLED RUNOUTS, 0 SCORES PREFLOP ALL-INS BY THEIR ACTUAL DELTA
+# NONE ENUMERATES ALL 1.7 MILLION OF THEM, ABOUT 5 SECONDS PER HAND
+ALL_IN_EV_PREFLOP_SAMPLES = 2000
+
+# SEEDS THE CARDS AND BOUNTIES OF A MATCH, NONE FOR AN UNSEEDED MATCH
+# A MATCH REPLAYED WITH THE SAME SEED AND THE SEATS SWAPPED IS ITS DUPLICATE
+GAME_SEED = None
+# THE DEALS ARE READ FROM THIS FILE, WHICH IS GENERATED FROM GAME_SEED IF MISSING
+# NONE KEEPS THE DEALS IN MEMORY ONLY
+DEAL_SCHEDULE_FILENAME = None
@@ -172,6 +172,12 @@ public:
             roundFlag = true;
             break;
           }
+          case 'N': {
+            // new match on the same connection
+            gameInfo = std::make_shared<GameInfo>(0, 0.0, 1);
+            roundFlag = true;
+            break;
+          }
           case 'Q': {
             return;
           }
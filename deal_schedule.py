@@ -0,0 +1,137 @@
+'''
+Pre-generated deal schedules: every hand, board and bounty of a match, from one seed.
+
+A schedule is a compact byte array with one fixed-width record per round:
+four hole card indices (two per seat), five board card indices and two bounty
+rank indices (one per seat). It can be saved to disk and memory-mapped, so the
+same deals can be replayed against different bots.
+'''
+import struct
+import random
+import mmap
+import sys
+import eval7
+
+MAGIC = b'PBDS'
+VERSION = 1
+HEADER = struct.Struct('<4sII')  # magic, version, number of rounds
+RECORD_SIZE = 11
+RANKS = '23456789TJQKA'
+# card index -> eval7.Card, in eval7's own deck order
+CARDS = tuple(eval7.Deck().cards)
+CARD_INDICES = range(len(CARDS))
+
+
+class Board():
+    '''
+    The five board cards of a round, with the peek interface of eval7.Deck.
+    '''
+    __slots__ = ('cards',)
+
+    def __init__(self, cards):
+        self.cards = cards
+
+    def peek(self, num_cards):
+        '''
+        Returns the first num_cards board cards.
+        '''
+        return self.cards[:num_cards]
+
+
+class DealSchedule():
+    '''
+    Read-only access to the deals of a match, one record per round.
+    '''
+
+    def __init__(self, data, num_rounds, handle=None):
+        self.data = data
+        self.num_rounds = num_rounds
+        self.handle = handle
+
+    @classmethod
+    def generate(cls, seed, num_rounds):
+        '''
+        Deals num_rounds rounds from one seed.
+        '''
+        rng = random.Random(seed)
+        data = bytearray(HEADER.pack(MAGIC, VERSION, num_rounds))
+        for _ in range(num_rounds):
+            data += bytes(rng.sample(CARD_INDICES, 9))
+            data.append(rng.randrange(len(RANKS)))
+            data.append(rng.randrange(len(RANKS)))
+        return cls(bytes(data), num_rounds)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Memory-maps a schedule file written by save.
+        '''
+        handle = open(path, 'rb')
+        try:
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, num_rounds = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(path + ' is not a version {} deal schedule'.format(VERSION))
+            if len(data) != HEADER.size + num_rounds * RECORD_SIZE:
+                raise ValueError(path + ' is truncated')
+        except Exception:
+            handle.close()
+            raise
+        return cls(data, num_rounds, handle)
+
+    def save(self, path):
+        '''
+        Writes the schedule to path.
+        '''
+        with open(path, 'wb') as schedule_file:
+            schedule_file.write(self.data)
+
+    def close(self):
+        '''
+        Releases the memory map, if any.
+        '''
+        if self.handle is not None:
+            self.data.close()
+            self.handle.close()
+            self.handle = None
+
+    def deal(self, round_num):
+        '''
+        Returns the hands and the Board of a round, counting rounds from 1.
+        '''
+        offset = HEADER.size + (round_num - 1) * RECORD_SIZE
+        record = self.data[offset:offset + 9]
+        return ([[CARDS[record[0]], CARDS[record[1]]], [CARDS[record[2]], CARDS[record[3]]]],
+                Board([CARDS[index] for index in record[4:9]]))
+
+    def bounties(self, round_num):
+        '''
+        Returns the bounty ranks drawn for each seat in a round, counting rounds from 1.
+
+        Only the rounds where bounties reset use them.
+        '''
+        offset = HEADER.size + (round_num - 1) * RECORD_SIZE + 9
+        return [RANKS[self.data[offset]], RANKS[self.data[offset + 1]]]
+
+
+def load_or_generate(path, seed, num_rounds):
+    '''
+    Loads the schedule at path, or generates it from seed and saves it there.
+
+    With no path the schedule is generated in memory only.
+    '''
+    if path is None:
+        return DealSchedule.generate(seed, num_rounds)
+    try:
+        return DealSchedule.load(path)
+    except FileNotFoundError:
+        schedule = DealSchedule.generate(seed, num_rounds)
+        schedule.save(path)
+        return schedule
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print('usage: python3 deal_schedule.py SEED NUM_ROUNDS PATH')
+        sys.exit(1)
+    DealSchedule.generate(int(sys.argv[1]), int(sys.argv[2])).save(sys.argv[3])
@@ -3,36 +3,74 @@
 DO NOT REMOVE, RENAME, OR EDIT THIS FILE
 '''
 from collections import namedtuple
-from threading import Thread
-from queue import Queue
+from contextlib import contextmanager, redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from array import array
+import importlib.util
+import tracemalloc
+import itertools
+import traceback
+import argparse
+import random
+import tempfile
+import shutil
+import gzip
+import lzma
 import time
 import math
 import json
 import subprocess
+import sqlite3
 import socket
 import eval7
 import sys
 import os
-import random
 
 sys.path.append(os.getcwd())
 from config import *
+from deal_schedule import load_or_generate, CARDS, RANKS
+from hand_history import HandHistoryWriter, ACTION_NAMES
+from latency import LatencyRecorder
+from bot_resources import ResourceRecorder
+from event_feed import EventFeed
+from results_db import record_match, record_rounds
+import match_spec
 
 FoldAction = namedtuple('FoldAction', [])
 CallAction = namedtuple('CallAction', [])
 CheckAction = namedtuple('CheckAction', [])
 # we coalesce BetAction and RaiseAction for convenience
 RaiseAction = namedtuple('RaiseAction', ['amount'])
-TerminalState = namedtuple('TerminalState', ['deltas', 'bounty_hits', 'previous_state'])
+# previous_state is the RoundState the round ended in, which holds the round's action history;
+# ev_deltas are the deltas with the all-in luck taken out, see RoundState.all_in_ev
+TerminalState = namedtuple('TerminalState', ['deltas', 'bounty_hits', 'previous_state', 'ev_deltas'])
 
 STREET_NAMES = ['Flop', 'Turn', 'River']
 DECODE = {'F': FoldAction, 'C': CallAction, 'K': CheckAction, 'R': RaiseAction}
+ACTION_CODES = {'FoldAction': 'F', 'CallAction': 'C', 'CheckAction': 'K', 'RaiseAction': 'R'}
+# action codes in RoundState histories, which are indices into ACTION_NAMES
+FOLD, CALL, CHECK, RAISE = (ACTION_NAMES.index(code) for code in 'FCKR')
+ACTION_INDICES = {FoldAction: FOLD, CallAction: CALL, CheckAction: CHECK, RaiseAction: RAISE}
+# action code and amount, then the button, street, pips and stacks the action was taken from
+HISTORY_STRIDE = 8
+BOUNTY_BITS = {rank: 1 << index for index, rank in enumerate(RANKS)}
+# the sets legal_actions returns, shared so that no set is built per query
+CHECK_FOLD = frozenset((CheckAction, FoldAction))
+CHECK_RAISE_FOLD = frozenset((CheckAction, RaiseAction, FoldAction))
+FOLD_CALL = frozenset((FoldAction, CallAction))
+FOLD_CALL_RAISE = frozenset((FoldAction, CallAction, RaiseAction))
 CCARDS = lambda cards: ','.join(map(str, cards))
 PCARDS = lambda cards: '[{}]'.format(' '.join(map(str, cards)))
+CARD_NAMES = {card: str(card) for card in CARDS}
+CARD_BYTES = {card: name.encode() for card, name in CARD_NAMES.items()}
+BCARDS = lambda cards: b','.join([CARD_BYTES[card] for card in cards])
+JCARDS = lambda cards: [str(card) for card in cards]
 PVALUE = lambda name, value: ', {} ({})'.format(name, value)
 STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
+EV_STATUS = lambda players: ''.join([PVALUE(p.name, round(p.ev_bankroll, 2)) for p in players])
 
-# Socket encoding scheme:
+# Socket encoding scheme (the same over TCP, Unix domain sockets and socket pairs):
 #
 # T#.### the player's game clock
 # P# the- player's index
@@ -46,6 +84,7 @@ STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 # D### the player's bankroll delta from the round
 # Y## (both numbers 0 or 1 (or # which means masked): first is player hit bounty, second is opponent hit bounty)
 #       Note: only winning player bounty hit is revealed (or both if split pot)
+# N new match: the bot resets its bankroll, game clock and round number and acks with K
 # Q game over
 #
 # Clauses are separated by spaces
@@ -55,10 +94,42 @@ STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 # Action history is sent once, including the player's actions
 
 
-class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks', 'hands', 'deck', 'bounties', 'previous_state'])):
+def rank_mask(cards):
+    '''
+    Returns the ranks among cards as a 13-bit mask, bit 0 for deuces up to bit 12 for aces.
+    '''
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.rank
+    return mask
+
+
+class RoundState():
     '''
     Encodes the game tree for one round of poker.
+
+    The state is mutable: apply advances it in place by one action and undo takes
+    the last action back, so walking the tree allocates no new states. The round's
+    actions are kept in one flat integer array, HISTORY_STRIDE entries per action,
+    instead of a chain of previous states.
     '''
+    __slots__ = ('button', 'street', 'pips', 'stacks', 'hands', 'deck', 'bounties', 'history',
+                 'rank_masks', 'bounty_bits')
+
+    def __init__(self, button, street, pips, stacks, hands, deck, bounties):
+        self.button = button
+        self.street = street
+        self.pips = pips
+        self.stacks = stacks
+        self.hands = hands
+        self.deck = deck
+        self.bounties = bounties
+        self.history = array('i')
+        # each player's hole card and board ranks as 13-bit masks, extended once per street
+        self.rank_masks = [0, 0]
+        self.compute_rank_masks()
+        self.bounty_bits = (BOUNTY_BITS.get(bounties[0], 0), BOUNTY_BITS.get(bounties[1], 0))
+
     def get_bounty_hits(self):
         '''
         Determines if each player hit their bounty card during the round.
@@ -67,30 +138,39 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         - Their hole cards
         - The community cards dealt so far
 
+        Both are already folded into the player's rank mask, so this is one bit test per player.
+
         Returns:
             tuple[bool, bool]: A tuple containing two booleans where:
                 - First boolean indicates if Player 1's bounty was hit
                 - Second boolean indicates if Player 2's bounty was hit
         '''
-        cards0 = self.hands[0] + ([] if self.street == 0 else self.deck.peek(self.street))
-        cards1 = self.hands[1] + ([] if self.street == 0 else self.deck.peek(self.street))
-        cardNames = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-        return (self.bounties[0] in [cardNames[card.rank] for card in cards0],
-                self.bounties[1] in [cardNames[card.rank] for card in cards1])
+        return ((self.rank_masks[0] & self.bounty_bits[0]) != 0,
+                (self.rank_masks[1] & self.bounty_bits[1]) != 0)
+
+    def compute_rank_masks(self):
+        '''
+        Recomputes each player's rank mask from their hole cards and the board dealt so far.
+        '''
+        board_mask = rank_mask(self.deck.peek(self.street)) if self.street else 0
+        self.rank_masks[0] = rank_mask(self.hands[0]) | board_mask
+        self.rank_masks[1] = rank_mask(self.hands[1]) | board_mask
 
-    def get_delta(self, winner_index: int) -> int:
+    def get_delta(self, winner_index: int, bounty_hits=None) -> int:
         '''Returns the delta after bounty rules are applied.
 
         Args:
             winner_index (int): Index of the winning player. Must be 0 (player A),
                 1 (player B), or 2 (split pot).
+            bounty_hits (tuple[bool, bool]): Whether each player hit their bounty,
+                defaults to get_bounty_hits() for the board dealt so far.
 
         Returns:
             int: The delta value after applying bounty rules.
         '''
         assert winner_index in [0, 1, 2]
 
-        bounty_hit_0, bounty_hit_1 = self.get_bounty_hits()
+        bounty_hit_0, bounty_hit_1 = self.get_bounty_hits() if bounty_hits is None else bounty_hits
 
         delta = 0
         if winner_index == 2:
@@ -134,7 +214,8 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
             TerminalState: A terminal state object containing:
                 - List of deltas (positive for winner, negative for loser)
                 - Tuple of bounty hit results for both players
-                - Reference to the previous game state
+                - The final round state
+                - List of all-in EV deltas, see all_in_ev
         
         Note:
             This method assumes both players have equal stacks when reaching showdown,
@@ -150,8 +231,65 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         else:
             # split the pot
             delta = self.get_delta(2)
-        
-        return TerminalState([int(delta), -int(delta)], self.get_bounty_hits(), self)
+        deltas = [int(delta), -int(delta)]
+        ev_delta = self.all_in_ev()
+        return TerminalState(deltas, self.get_bounty_hits(), self,
+                             deltas if ev_delta is None else [ev_delta, -ev_delta])
+
+    def all_in_street(self):
+        '''
+        Returns the street on which the betting closed with both players all-in, or None.
+        '''
+        if self.stacks[0] or self.stacks[1]:
+            return None
+        # once both players are all-in, only checks follow the action that closed the betting
+        history = self.history
+        for i in range(len(history) - HISTORY_STRIDE, -1, -HISTORY_STRIDE):
+            if history[i] != CHECK:
+                return history[i + 3]
+        return None
+
+    def all_in_ev(self):
+        '''
+        Returns seat 0's luck-adjusted delta at showdown when both players were
+        all-in before the river and ALL_IN_EV is on, or None otherwise.
+
+        The delta is averaged over every runout of the board left to come when the
+        betting closed, with the bounty rules of get_delta applied to each. Preflop
+        there are 1.7 million runouts, so ALL_IN_EV_PREFLOP_SAMPLES of them are drawn
+        instead, from a generator seeded by the hole cards, unless it is None, and
+        none at all if it is 0.
+        '''
+        if not ALL_IN_EV:
+            return None
+        street = self.all_in_street()
+        if street is None or street == 5 or (street == 0 and ALL_IN_EV_PREFLOP_SAMPLES == 0):
+            return None
+        board = self.deck.peek(street)
+        dealt = set(self.hands[0] + self.hands[1] + board)
+        unseen = [card for card in CARDS if card not in dealt]
+        if street == 0 and ALL_IN_EV_PREFLOP_SAMPLES is not None:
+            rng = random.Random(CCARDS(self.hands[0] + self.hands[1]))
+            runouts = (rng.sample(unseen, 5) for _ in range(ALL_IN_EV_PREFLOP_SAMPLES))
+        else:
+            runouts = itertools.combinations(unseen, 5 - street)
+        cards0 = board + self.hands[0]
+        cards1 = board + self.hands[1]
+        mask0 = rank_mask(cards0)
+        mask1 = rank_mask(cards1)
+        # the delta depends only on the winner and the bounty hits, so count those
+        outcomes = {}
+        for runout in runouts:
+            runout = list(runout)
+            score0 = eval7.evaluate(cards0 + runout)
+            score1 = eval7.evaluate(cards1 + runout)
+            runout_mask = rank_mask(runout)
+            outcome = (0 if score0 > score1 else 1 if score0 < score1 else 2,
+                       ((mask0 | runout_mask) & self.bounty_bits[0]) != 0,
+                       ((mask1 | runout_mask) & self.bounty_bits[1]) != 0)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        total = sum(outcomes.values())
+        return sum(count * self.get_delta(winner, hits) for (winner, *hits), count in outcomes.items()) / total
 
     def legal_actions(self):
         '''
@@ -162,11 +300,11 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         if continue_cost == 0:
             # we can only raise the stakes if both players can afford it
             bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
-            return {CheckAction, FoldAction} if bets_forbidden else {CheckAction, RaiseAction, FoldAction}
+            return CHECK_FOLD if bets_forbidden else CHECK_RAISE_FOLD
         # continue_cost > 0
         # similarly, re-raising is only allowed if both players can afford it
         raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
-        return {FoldAction, CallAction} if raises_forbidden else {FoldAction, CallAction, RaiseAction}
+        return FOLD_CALL if raises_forbidden else FOLD_CALL_RAISE
 
     def raise_bounds(self):
         '''
@@ -181,15 +319,23 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
     def proceed_street(self):
         '''
         Resets the players' pips and advances the game tree to the next round of betting.
+
+        Returns the TerminalState after the river, otherwise None.
         '''
         if self.street == 5:
             return self.showdown()
-        new_street = 3 if self.street == 0 else self.street + 1
-        return RoundState(1, new_street, [0, 0], self.stacks, self.hands, self.deck, self.bounties, self)
+        dealt = self.street
+        self.street = 3 if dealt == 0 else dealt + 1
+        board_mask = rank_mask(self.deck.peek(self.street)[dealt:])
+        self.rank_masks[0] |= board_mask
+        self.rank_masks[1] |= board_mask
+        self.button = 1
+        self.pips[0] = self.pips[1] = 0
+        return None
 
-    def proceed(self, action):
+    def apply(self, action):
         '''
-        Advances the game tree by one action performed by the active player.
+        Advances the game tree in place by one action performed by the active player.
 
         Args:
             action: The action being performed. Must be one of:
@@ -200,59 +346,229 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
 
         Returns:
             Either:
-            - RoundState: The new state after the action is performed
+            - None: The round goes on from this state
             - TerminalState: If the action ends the hand (e.g., fold or final call)
 
         Note:
             The button value is incremented after each action to track whose turn it is.
-            For FoldAction, the inactive player is awarded the pot.
+            For FoldAction, the inactive player is awarded the pot and the state is
+            left as it was before the fold.
             For CallAction on button 0, both players post blinds.
             For CheckAction, advances to next street if both players have acted.
             For RaiseAction, updates pips and stacks based on raise amount.
         '''
+        pips = self.pips
+        stacks = self.stacks
+        code = ACTION_INDICES[type(action)]
+        self.history.extend((code, action.amount if code == RAISE else 0, self.button, self.street,
+                             pips[0], pips[1], stacks[0], stacks[1]))
         active = self.button % 2
-        if isinstance(action, FoldAction):
-            delta = self.get_delta((1 - active) % 2) # if active folds, the other player (1 - active) wins
-            return TerminalState([delta, -delta], self.get_bounty_hits(), self)
-        if isinstance(action, CallAction):
+        if code == FOLD:
+            delta = self.get_delta(1 - active)  # if active folds, the other player (1 - active) wins
+            return TerminalState([delta, -delta], self.get_bounty_hits(), self, [delta, -delta])
+        if code == CALL:
             if self.button == 0:  # sb calls bb
-                return RoundState(1, 0, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands, self.deck, self.bounties, self)
+                pips[0] = pips[1] = BIG_BLIND
+                stacks[0] = stacks[1] = STARTING_STACK - BIG_BLIND
+                self.button = 1
+                return None
             # both players acted
-            new_pips = list(self.pips)
-            new_stacks = list(self.stacks)
-            contribution = new_pips[1-active] - new_pips[active]
-            new_stacks[active] -= contribution
-            new_pips[active] += contribution
-            state = RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self.bounties, self)
-            return state.proceed_street()
-        if isinstance(action, CheckAction):
+            contribution = pips[1-active] - pips[active]
+            stacks[active] -= contribution
+            pips[active] += contribution
+            self.button += 1
+            return self.proceed_street()
+        if code == CHECK:
             if (self.street == 0 and self.button > 0) or self.button > 1:  # both players acted
                 return self.proceed_street()
             # let opponent act
-            return RoundState(self.button + 1, self.street, self.pips, self.stacks, self.hands, self.deck, self.bounties, self)
-        # isinstance(action, RaiseAction)
-        new_pips = list(self.pips)
-        new_stacks = list(self.stacks)
-        contribution = action.amount - new_pips[active]
-        new_stacks[active] -= contribution
-        new_pips[active] += contribution
-        return RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self.bounties, self)
+            self.button += 1
+            return None
+        # code == RAISE
+        contribution = action.amount - pips[active]
+        stacks[active] -= contribution
+        pips[active] += contribution
+        self.button += 1
+        return None
+
+    def undo(self):
+        '''
+        Takes back the last action applied, restoring the state it was taken from.
+        '''
+        history = self.history
+        end = len(history)
+        self.button = history[end - 6]
+        if self.street != history[end - 5]:
+            self.street = history[end - 5]
+            self.compute_rank_masks()
+        self.pips[0] = history[end - 4]
+        self.pips[1] = history[end - 3]
+        self.stacks[0] = history[end - 2]
+        self.stacks[1] = history[end - 1]
+        del history[end - HISTORY_STRIDE:]
+
+    def actions(self):
+        '''
+        Returns the round's actions so far as (action code, amount) pairs, where the
+        code is an index into ACTION_NAMES and the amount is 0 unless it is a raise.
+        '''
+        history = self.history
+        return [(history[i], history[i + 1]) for i in range(0, len(history), HISTORY_STRIDE)]
+
+
+class PlayerMessage():
+    '''
+    The clauses one player has not been sent yet.
+
+    The clauses both players are sent, boards and actions, are encoded once into
+    a buffer the two PlayerMessages of a game share, and reused from round to
+    round; each player keeps only how far into it they have been sent, and their
+    own clauses for the start and the end of the round, and their seat in the
+    round. Every clause is stored with the space that precedes it, so render
+    returns the message in pieces, which send_message writes with one sendmsg
+    call and no joining.
+    '''
+    __slots__ = ('public', 'sent', 'head', 'tail', 'seat')
+
+    def __init__(self, public):
+        self.public = public
+        self.sent = 0
+        self.head = b''
+        self.tail = b''
+        self.seat = 0
+
+    def start_round(self, seat, head, keep_unsent=False):
+        '''
+        Starts a new round in seat with head, before the shared buffer is emptied.
+
+        Anything left unsent from the last round is dropped, or with keep_unsent
+        sent ahead of head, as the results of a round are with DEFER_ROUND_OVER.
+        '''
+        if keep_unsent:
+            head = self.head + self.public[self.sent:] + self.tail + head
+        self.sent = 0
+        self.head = head
+        self.tail = b''
+        self.seat = seat
+
+    def render(self, game_clock):
+        '''
+        Returns the pieces of the message to send, with the game clock.
+        '''
+        return (b'T%.3f' % game_clock, self.head, self.public[self.sent:], self.tail, b'\n')
+
+    def clear(self):
+        '''
+        Marks everything rendered so far as sent.
+        '''
+        self.sent = len(self.public)
+        self.head = self.tail = b''
+
+
+def send_message(sock, pieces):
+    '''
+    Sends the pieces of a message with one sendmsg call, sending the rest with
+    sendall in the rare case the kernel takes only part of them.
+
+    Where sockets have no sendmsg (Windows), the pieces are joined and sent with sendall.
+    '''
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(pieces))
+        return
+    sent = sock.sendmsg(pieces)
+    if sent < sum(map(len, pieces)):
+        sock.sendall(b''.join(pieces)[sent:])
+
+
+class BotOutput():
+    '''
+    Captures a bot's output in a fixed amount of memory.
+
+    The first half of limit bytes is kept as it arrives and the last half in a
+    ring buffer, so a bot that prints without end costs no more than limit bytes.
+    Anything in between is dropped as soon as it is pushed out of the ring, and
+    only counted. Writes may come from a reader thread while the engine reads.
+    '''
+
+    def __init__(self, limit):
+        self.head_limit = limit // 2
+        self.ring = bytearray(limit - self.head_limit)
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        Drops everything captured so far.
+        '''
+        self.head = bytearray()
+        self.tail_size = 0  # bytes that went past the head, kept or not
+
+    def write(self, data):
+        '''
+        Captures a block of output.
+        '''
+        with self.lock:
+            if len(self.head) < self.head_limit:
+                taken = self.head_limit - len(self.head)
+                self.head += data[:taken]
+                data = data[taken:]
+            ring_size = len(self.ring)
+            if not data or not ring_size:
+                self.tail_size += len(data)
+                return
+            position = self.tail_size % ring_size
+            self.tail_size += len(data)
+            if len(data) > ring_size:
+                # only the last ring_size bytes survive, and they end where this write ends
+                position = self.tail_size % ring_size
+                data = data[-ring_size:]
+            first = min(len(data), ring_size - position)
+            self.ring[position:position + first] = data[:first]
+            self.ring[:len(data) - first] = data[first:]
+
+    def dropped(self):
+        '''
+        Returns the number of bytes dropped between the head and the tail.
+        '''
+        return max(self.tail_size - len(self.ring), 0)
+
+    def getvalue(self):
+        '''
+        Returns the kept head and tail, with a note of how much was dropped in between.
+        '''
+        with self.lock:
+            if self.tail_size <= len(self.ring):
+                return bytes(self.head + self.ring[:self.tail_size])
+            position = self.tail_size % len(self.ring) if self.ring else 0
+            note = '\n[... {} bytes of output dropped ...]\n'.format(self.dropped()).encode()
+            return bytes(self.head + note + self.ring[position:] + self.ring[:position])
 
 
 class Player():
     '''
     Handles subprocess and socket interactions with one player's pokerbot.
     '''
+    # whether the bot can be started and stopped in a thread while the other one is
+    thread_safe = True
+    # whether the bot can be sent a round's results with the next round's first message, see DEFER_ROUND_OVER
+    defers_round_over = True
 
-    def __init__(self, name, path):
+    def __init__(self, name, path, log_path=None):
         self.name = name
         self.path = path
+        self.log_path = name + '.txt' if log_path is None else log_path
         self.game_clock = STARTING_GAME_CLOCK
         self.bankroll = 0
+        self.ev_bankroll = 0.
         self.commands = None
         self.bot_subprocess = None
+        self.socket = None
         self.socketfile = None
-        self.bytes_queue = Queue()
+        self.output = BotOutput(PLAYER_LOG_SIZE_LIMIT)
+        self.matches_played = 0
+        self.latency = None if LATENCY_FILENAME is None else LatencyRecorder()
+        self.resources = None  # the bot's CPU time, memory and context switches, see watch_resources
+        self.timings = {}  # seconds spent in each setup and teardown phase of the match
 
     def build(self):
         '''
@@ -276,70 +592,190 @@ class Player():
                 proc = subprocess.run(self.commands['build'],
                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                                       cwd=self.path, timeout=BUILD_TIMEOUT, check=False)
-                self.bytes_queue.put(proc.stdout)
+                self.output.write(proc.stdout)
             except subprocess.TimeoutExpired as timeout_expired:
                 error_message = 'Timed out waiting for ' + self.name + ' to build'
                 print(error_message)
-                self.bytes_queue.put(timeout_expired.stdout)
-                self.bytes_queue.put(error_message.encode())
+                self.output.write(timeout_expired.stdout or b'')
+                self.output.write(error_message.encode())
             except (TypeError, ValueError):
                 print(self.name, 'build command misformatted')
             except OSError:
                 print(self.name, 'build failed - check "build" in commands.json')
 
+    def spawn(self, arguments, pass_fds=()):
+        '''
+        Starts the pokerbot subprocess with the given connection arguments.
+        '''
+        start_time = time.perf_counter()
+        proc = subprocess.Popen(self.commands['run'] + arguments,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                cwd=self.path, pass_fds=pass_fds)
+        self.timings['spawn'] = time.perf_counter() - start_time
+        self.bot_subprocess = proc
+        # function for bot listening, in blocks of whatever the pipe holds
+        def enqueue_output(out, output):
+            try:
+                while True:
+                    block = out.read1(65536)
+                    if not block:
+                        break
+                    if self.path == r"./player_chatbot":
+                        print(block.decode("utf-8", "replace"), end='', flush=True)
+                    else:
+                        output.write(block)
+            except ValueError:
+                pass
+        # start a separate bot listening thread which dies with the program
+        Thread(target=enqueue_output, args=(proc.stdout, self.output), daemon=True).start()
+
     def run(self):
         '''
         Runs the pokerbot and establishes the socket connection.
+
+        The "transport" entry of commands.json picks the connection: "tcp" (the
+        default) listens on a localhost port, "unix" on a Unix domain socket, and
+        "socketpair" hands the bot one end of a connected socket pair, so there
+        is nothing to accept.
         '''
         if self.commands is not None and len(self.commands['run']) > 0:
+            transport = self.commands.get('transport', 'tcp')
+            listen_dir = None
             try:
-                server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                with server_socket:
-                    server_socket.bind(('', 0))
-                    server_socket.settimeout(CONNECT_TIMEOUT)
-                    server_socket.listen()
-                    port = server_socket.getsockname()[1]
-                    proc = subprocess.Popen(self.commands['run'] + [str(port)],
-                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                            cwd=self.path)
-                    self.bot_subprocess = proc
-                    # function for bot listening
-                    def enqueue_output(out, queue):
-                        try:
-                            for line in out:
-                                if self.path == r"./player_chatbot":
-                                    print(line.strip().decode("utf-8"))
-                                else:
-                                    queue.put(line)
-                        except ValueError:
-                            pass
-                    # start a separate bot listening thread which dies with the program
-                    Thread(target=enqueue_output, args=(proc.stdout, self.bytes_queue), daemon=True).start()
-                    # block until we timeout or the player connects
-                    client_socket, _ = server_socket.accept()
-                    with client_socket:
-                        if self.path == r"./player_chatbot":
-                            client_socket.settimeout(PLAYER_TIMEOUT)
+                if transport == 'socketpair':
+                    client_socket, bot_socket = socket.socketpair()
+                    with bot_socket:
+                        self.spawn(['--fd', str(bot_socket.fileno())], pass_fds=(bot_socket.fileno(),))
+                elif transport in ('tcp', 'unix'):
+                    if transport == 'unix':
+                        listen_dir = tempfile.mkdtemp(prefix='pokerbots')
+                        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    else:
+                        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    with server_socket:
+                        if transport == 'unix':
+                            address = os.path.join(listen_dir, 'bot.sock')
+                            server_socket.bind(address)
+                            arguments = ['--unix', address]
                         else:
-                            client_socket.settimeout(CONNECT_TIMEOUT)
-                        sock = client_socket.makefile('rw')
-                        self.socketfile = sock
-                        print(self.name, 'connected successfully')
+                            server_socket.bind(('', 0))
+                            arguments = [str(server_socket.getsockname()[1])]
+                        server_socket.settimeout(CONNECT_TIMEOUT)
+                        server_socket.listen()
+                        self.spawn(arguments)
+                        # block until we timeout or the player connects
+                        start_time = time.perf_counter()
+                        client_socket, _ = server_socket.accept()
+                        self.timings['connect'] = time.perf_counter() - start_time
+                else:
+                    print(self.name, 'unknown transport', transport, '- check "transport" in commands.json')
+                    return
+                if self.path == r"./player_chatbot":
+                    client_socket.settimeout(PLAYER_TIMEOUT)
+                else:
+                    client_socket.settimeout(CONNECT_TIMEOUT)
+                # queries are sent on the socket itself and responses read through the file
+                self.socket = client_socket
+                self.socketfile = client_socket.makefile('rw')
+                print(self.name, 'connected successfully')
             except (TypeError, ValueError):
                 print(self.name, 'run command misformatted')
+            except socket.timeout:
+                print('Timed out waiting for', self.name, 'to connect')
             except OSError:
                 print(self.name, 'run failed - check "run" in commands.json')
+            finally:
+                if listen_dir is not None:
+                    shutil.rmtree(listen_dir, ignore_errors=True)
+
+    def start_match(self):
+        '''
+        Builds and runs the pokerbot for its first match, and reuses it for later
+        ones if its commands.json has "warm": true, or restarts it if not.
+        '''
+        if self.matches_played == 0:
+            start_time = time.perf_counter()
+            self.build()
+            self.timings['build'] = time.perf_counter() - start_time
+            self.run()
+        elif not self.warm():
+            self.stop()
+            self.reset()
+            self.socket = self.socketfile = self.bot_subprocess = None
+            self.run()
+        else:
+            start_time = time.perf_counter()
+            self.new_match()
+            self.timings['new_match'] = time.perf_counter() - start_time
+        self.matches_played += 1
+        self.watch_resources()
+
+    def watch_resources(self):
+        '''
+        Starts recording the bot subprocess's resource usage, if BOT_RESOURCES is on.
+        '''
+        if BOT_RESOURCES and self.bot_subprocess is not None:
+            self.resources = ResourceRecorder(self.bot_subprocess.pid)
+
+    def warm(self):
+        '''
+        Returns whether the pokerbot declares that its runner handles the N clause
+        of a new match, so it can be kept running between matches.
+
+        Older runners skip N and still acknowledge it, carrying their bankroll and
+        round number over, so bots have to opt in with "warm": true in commands.json.
+        '''
+        return self.commands is None or self.commands.get('warm') is True
+
+    def reset(self):
+        '''
+        Resets the bankroll, game clock, latency records and timings for a new match.
+        '''
+        self.bankroll = 0
+        self.ev_bankroll = 0.
+        self.game_clock = STARTING_GAME_CLOCK
+        self.latency = None if LATENCY_FILENAME is None else LatencyRecorder()
+        self.resources = None
+        self.timings = {}
+
+    def new_match(self):
+        '''
+        Tells a still connected pokerbot that a new match starts, and resets the
+        bankroll and game clock, without restarting the bot.
+        '''
+        self.reset()
+        if self.socketfile is not None:
+            try:
+                self.socketfile.write('N\n')
+                self.socketfile.flush()
+                if self.socketfile.readline().strip() != 'K':
+                    print(self.name, 'did not acknowledge the new match')
+                    self.game_clock = 0.
             except socket.timeout:
-                print('Timed out waiting for', self.name, 'to connect')
+                print('Timed out waiting for', self.name, 'to start a new match')
+                self.game_clock = 0.
+            except OSError:
+                print(self.name, 'disconnected')
+                self.game_clock = 0.
+
+    def write_log(self):
+        '''
+        Writes the bot output collected since the last call to the player's log file.
+        '''
+        with open(self.log_path, 'wb') as log_file:
+            log_file.write(self.output.getvalue())
+        self.output.clear()
 
     def stop(self):
         '''
         Closes the socket connection and stops the pokerbot.
         '''
+        start_time = time.perf_counter()
         if self.socketfile is not None:
             try:
                 self.socketfile.write('Q\n')
                 self.socketfile.close()
+                self.socket.close()
             except socket.timeout:
                 print('Timed out waiting for', self.name, 'to disconnect')
             except OSError:
@@ -350,21 +786,14 @@ class Player():
                     outs, _ = self.bot_subprocess.communicate(timeout=PLAYER_TIMEOUT)
                 else:
                     outs, _ = self.bot_subprocess.communicate(timeout=CONNECT_TIMEOUT)
-                self.bytes_queue.put(outs)
+                self.output.write(outs or b'')
             except subprocess.TimeoutExpired:
                 print('Timed out waiting for', self.name, 'to quit')
                 self.bot_subprocess.kill()
                 outs, _ = self.bot_subprocess.communicate()
-                self.bytes_queue.put(outs)
-        with open(self.name + '.txt', 'wb') as log_file:
-            bytes_written = 0
-            for output in self.bytes_queue.queue:
-                try:
-                    bytes_written += log_file.write(output)
-                    if bytes_written >= PLAYER_LOG_SIZE_LIMIT:
-                        break
-                except TypeError:
-                    pass
+                self.output.write(outs or b'')
+        self.timings['teardown'] = time.perf_counter() - start_time
+        self.write_log()
 
     def query(self, round_state, player_message, game_log):
         '''
@@ -376,8 +805,8 @@ class Player():
 
         Args:
             round_state (RoundState or TerminalState): The current state of the game.
-            player_message (list): Messages to be sent to the player bot, including game state
-                information like time remaining, player position, and cards.
+            player_message (PlayerMessage): The clauses not yet sent to the player bot, with
+                game state information like player position, cards and actions.
             game_log (list): A list to store game events and error messages.
 
         Returns:
@@ -396,28 +825,21 @@ class Player():
         if self.socketfile is not None and self.game_clock > 0.:
             clause = ''
             try:
-                player_message[0] = 'T{:.3f}'.format(self.game_clock)
-                message = ' '.join(player_message) + '\n'
-                del player_message[1:]  # do not send redundant action history
+                message = player_message.render(self.game_clock)
                 start_time = time.perf_counter()
-                self.socketfile.write(message)
-                self.socketfile.flush()
+                send_message(self.socket, message)
+                player_message.clear()  # do not send redundant action history
                 clause = self.socketfile.readline().strip()
                 end_time = time.perf_counter()
+                if self.latency is not None:
+                    self.latency.record(getattr(round_state, 'street', None), clause, end_time - start_time)
                 if ENFORCE_GAME_CLOCK and self.path != r"./player_chatbot":
                     self.game_clock -= end_time - start_time
                 if self.game_clock <= 0.:
                     raise socket.timeout
-                action = DECODE[clause[0]]
-                if action in legal_actions:
-                    if clause[0] == 'R':
-                        amount = int(clause[1:])
-                        min_raise, max_raise = round_state.raise_bounds()
-                        if min_raise <= amount <= max_raise:
-                            return action(amount)
-                    else:
-                        return action()
-                game_log.append(self.name + ' attempted illegal ' + action.__name__)
+                action = self.decode_action(clause, round_state, legal_actions, game_log)
+                if action is not None:
+                    return action
             except socket.timeout:
                 error_message = self.name + ' ran out of time'
                 game_log.append(error_message)
@@ -432,71 +854,714 @@ class Player():
                 game_log.append(self.name + ' response misformatted: ' + str(clause))
         return CheckAction() if CheckAction in legal_actions else FoldAction()
 
+    def decode_action(self, clause, round_state, legal_actions, game_log):
+        '''
+        Decodes one response clause into an action, or returns None if it is illegal.
+
+        Raises IndexError, KeyError or ValueError if the clause is misformatted.
+        '''
+        action = DECODE[clause[0]]
+        if action in legal_actions:
+            if clause[0] == 'R':
+                amount = int(clause[1:])
+                min_raise, max_raise = round_state.raise_bounds()
+                if min_raise <= amount <= max_raise:
+                    return action(amount)
+            else:
+                return action()
+        game_log.append(self.name + ' attempted illegal ' + action.__name__)
+        return None
+
+
+class _BoundedTextLog():
+    '''
+    A write-only text sink that keeps at most limit characters.
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.chunks = []
+
+    def write(self, text):
+        '''
+        Keeps text until the limit is reached and silently drops the rest.
+        '''
+        if self.size < self.limit:
+            self.chunks.append(text[:self.limit - self.size])
+        self.size += len(text)
+        return len(text)
+
+    def flush(self):
+        '''
+        Nothing is buffered outside of memory.
+        '''
+
+    def getvalue(self):
+        '''
+        Returns everything kept so far.
+        '''
+        return ''.join(self.chunks)
+
+
+class _RoutedStdout():
+    '''
+    Stands in for sys.stdout while in-process bots play a match, writing to the
+    output of the bot being queried, and to the engine's stdout otherwise.
+    '''
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.target = stdout
+
+    def write(self, text):
+        '''
+        Writes text to the current target.
+        '''
+        return self.target.write(text)
+
+    def flush(self):
+        '''
+        Flushes the current target.
+        '''
+        self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+@contextmanager
+def _bot_context(path, stdout):
+    '''
+    Runs bot code from inside its own directory with its prints captured.
+    '''
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        with redirect_stdout(stdout):
+            yield
+    finally:
+        os.chdir(cwd)
+
+
+_BOT_MODULE_IDS = itertools.count()
+
+
+def _is_local_module(module, path):
+    '''
+    Returns True if module was loaded from a file or package under path.
+    '''
+    locations = [getattr(module, '__file__', None)] + list(getattr(module, '__path__', []))
+    return any(location is not None and os.path.abspath(location).startswith(path + os.sep)
+               for location in locations)
+
+
+def load_bot_module(path):
+    '''
+    Imports player.py from a pokerbot directory.
+
+    Returns the module and the bot's own skeleton.states module. Modules local to the
+    pokerbot directory (its skeleton package, helpers) are dropped from sys.modules
+    afterwards, so two pokerbots with different skeletons can live in one process.
+    '''
+    path = os.path.abspath(path)
+    before = set(sys.modules)
+    sys.path.insert(0, path)
+    try:
+        spec = importlib.util.spec_from_file_location('_pokerbot_{}'.format(next(_BOT_MODULE_IDS)),
+                                                      os.path.join(path, 'player.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        states = sys.modules['skeleton.states']
+    finally:
+        sys.path.remove(path)
+        for name in set(sys.modules) - before:
+            if _is_local_module(sys.modules[name], path):
+                del sys.modules[name]
+    return module, states
+
+
+class InProcessPlayer(Player):
+    '''
+    Runs one player's pokerbot inside the engine process.
+
+    The Bot subclass is imported directly from the player's directory and its
+    handle_new_round, get_action and handle_round_over methods are called
+    without a subprocess or socket. No clauses are rendered or parsed: the bot's
+    own skeleton states are built straight from the engine's RoundState, by
+    replaying its action history into them, so the bot sees exactly what the
+    socket skeleton would reconstruct.
+    '''
+    # importing a bot changes sys.path and sys.modules, and running it the working directory
+    thread_safe = False
+    # a round's results cost no round trip, so the bot is told them as the round ends
+    defers_round_over = False
+
+    def __init__(self, name, path, log_path=None, class_name='Player'):
+        super().__init__(name, path, log_path)
+        self.class_name = class_name
+        self.pokerbot = None
+        self.skeleton = None
+        self.stdout = _BoundedTextLog(PLAYER_LOG_SIZE_LIMIT)
+        self.routed_stdout = None
+        self.bot_game_state = None
+        self.bot_round_state = None
+        # the engine's RoundState the bot's view follows, how much of its history the
+        # bot has seen, and the board of each street dealt so far
+        self.engine_state = None
+        self.replayed = 0
+        self.boards = None
+        self.round_flag = True
+
+    def build(self):
+        '''
+        Imports the pokerbot module and instantiates its Bot subclass.
+        '''
+        # resolved before the bot context changes into the directory it names
+        path = os.path.abspath(self.path)
+        if not os.path.isfile(os.path.join(path, 'player.py')):
+            print(self.name, 'player.py not found - check PLAYER_PATH')
+            return
+        try:
+            with _bot_context(path, self.stdout):
+                module, self.skeleton = load_bot_module(path)
+            bot_class = getattr(module, self.class_name, None)
+            if bot_class is None:
+                print(self.name, 'player.py has no class', self.class_name)
+                return
+            with _bot_context(path, self.stdout):
+                self.pokerbot = bot_class()
+            self.bot_game_state = self.skeleton.GameState(0, 0., 1)
+        except Exception:  # pylint: disable=broad-except
+            self.pokerbot = None
+            self.stdout.write(traceback.format_exc())
+            print(self.name, 'failed to load - see', self.log_path)
+
+    def run(self):
+        '''
+        In-process bots need no connection; report that the bot is ready.
+        '''
+        if self.pokerbot is not None:
+            print(self.name, 'loaded in-process')
+
+    def start_match(self):
+        '''
+        Loads or resets the pokerbot, and routes stdout through _RoutedStdout for
+        the match, so that the bot's prints can be captured without swapping
+        sys.stdout on every query.
+        '''
+        super().start_match()
+        if not isinstance(sys.stdout, _RoutedStdout):
+            sys.stdout = _RoutedStdout(sys.stdout)
+        self.routed_stdout = sys.stdout
+
+    def new_match(self):
+        '''
+        Resets the bankroll, game clock and the bot's view of the game.
+        '''
+        self.reset()
+        if self.pokerbot is not None:
+            self.bot_game_state = self.skeleton.GameState(0, 0., 1)
+            self.bot_round_state = None
+            self.engine_state = None
+            self.round_flag = True
+
+    def write_log(self):
+        '''
+        Writes the bot output captured since the last call to the player's log file,
+        and gives the engine its own stdout back.
+        '''
+        if isinstance(sys.stdout, _RoutedStdout):
+            sys.stdout = sys.stdout.stdout
+        with open(self.log_path, 'w') as log_file:
+            log_file.write(self.stdout.getvalue())
+        self.stdout = _BoundedTextLog(PLAYER_LOG_SIZE_LIMIT)
+
+    def stop(self):
+        '''
+        Writes the captured bot output to the player's log file.
+        '''
+        self.write_log()
+
+    def query(self, round_state, player_message, game_log):
+        '''
+        Requests one action from the in-process pokerbot.
+
+        Behaves like Player.query: the bot learns the same things in the same
+        order, the game clock is charged for the time spent inside the bot, and
+        a bot that raises an exception is treated like a disconnected socket bot.
+        '''
+        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else {CheckAction}
+        # the bot reads the game from round_state, so its clauses are never rendered
+        player_message.clear()
+        if self.pokerbot is not None and self.game_clock > 0.:
+            bot_action = None
+            routed_stdout = self.routed_stdout
+            try:
+                # only the stdout of the match is pointed at the bot: its directory is the
+                # working directory while it is imported and constructed, not while it plays
+                routed_stdout.target = self.stdout
+                start_time = time.perf_counter()
+                try:
+                    bot_action = self.deliver(round_state, player_message.seat)
+                finally:
+                    routed_stdout.target = routed_stdout.stdout
+                end_time = time.perf_counter()
+                if self.latency is not None:
+                    self.latency.record(getattr(round_state, 'street', None),
+                                        'K' if bot_action is None else ACTION_CODES.get(type(bot_action).__name__, ''),
+                                        end_time - start_time)
+            except Exception:  # pylint: disable=broad-except
+                self.stdout.write(traceback.format_exc())
+                error_message = self.name + ' crashed'
+                game_log.append(error_message)
+                print(error_message)
+                self.game_clock = 0.
+                return CheckAction() if CheckAction in legal_actions else FoldAction()
+            if ENFORCE_GAME_CLOCK:
+                self.game_clock -= end_time - start_time
+            if self.game_clock <= 0.:
+                error_message = self.name + ' ran out of time'
+                game_log.append(error_message)
+                print(error_message)
+                self.game_clock = 0.
+            elif bot_action is not None:
+                try:
+                    action = self.convert_action(bot_action, round_state, legal_actions, game_log)
+                    if action is not None:
+                        return action
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    game_log.append(self.name + ' response misformatted: ' + str(bot_action))
+        return CheckAction() if CheckAction in legal_actions else FoldAction()
+
+    def deliver(self, round_state, seat):
+        '''
+        Brings the bot's view of the game up to round_state, a RoundState or the
+        TerminalState that ends one, and returns the bot's action, or None once
+        the round is over.
+
+        seat is the bot's seat in the round. The bot's skeleton states are built
+        straight from the engine's history, which holds the state every action
+        was taken from, into the same chain of previous states the skeleton Runner
+        would reconstruct from the clauses of the round.
+        '''
+        states = self.skeleton
+        bot_round_state = states.RoundState
+        terminal = not isinstance(round_state, RoundState)
+        engine_state = round_state.previous_state if terminal else round_state
+        game_state = states.GameState(self.bot_game_state.bankroll, self.game_clock, self.bot_game_state.round_num)
+        if engine_state is not self.engine_state:
+            # the first message of the round
+            self.engine_state = engine_state
+            self.replayed = 0
+            self.boards = {0: []}
+            hands = [[], []]
+            hands[seat] = [CARD_NAMES[card] for card in engine_state.hands[seat]]
+            bounties = ['-1', '-1']
+            bounties[seat] = engine_state.bounties[seat]
+            self.bot_round_state = bot_round_state(0, 0, [SMALL_BLIND, BIG_BLIND],
+                                                   [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND],
+                                                   hands, bounties, [], None)
+            if self.round_flag:
+                self.pokerbot.handle_new_round(game_state, self.bot_round_state, seat)
+                self.round_flag = False
+        bot_state = self.bot_round_state
+        hands, bounties, boards = bot_state.hands, bot_state.bounties, self.boards
+        history = engine_state.history
+        end = len(history)
+        for i in range(self.replayed, end, HISTORY_STRIDE):
+            code = history[i]
+            if code == FOLD:
+                break
+            button, street = history[i + 2], history[i + 3]
+            if code == CALL and button > 0:
+                # the skeleton settles a call in a state of its own before the street closes
+                active = button % 2
+                pips, stacks = [history[i + 4], history[i + 5]], [history[i + 6], history[i + 7]]
+                stacks[active] -= pips[1-active] - pips[active]
+                pips[active] = pips[1-active]
+                bot_state = bot_round_state(button + 1, street, pips, stacks, hands, bounties, boards[street], bot_state)
+            if i + HISTORY_STRIDE < end:
+                # the next action was taken from the state this one led to
+                button, street = history[i + HISTORY_STRIDE + 2], history[i + HISTORY_STRIDE + 3]
+                pips = [history[i + HISTORY_STRIDE + 4], history[i + HISTORY_STRIDE + 5]]
+                stacks = [history[i + HISTORY_STRIDE + 6], history[i + HISTORY_STRIDE + 7]]
+            elif terminal:
+                break  # the river closed
+            else:
+                button, street = engine_state.button, engine_state.street
+                pips, stacks = list(engine_state.pips), list(engine_state.stacks)
+            board = boards.get(street)
+            if board is None:
+                board = boards[street] = [CARD_NAMES[card] for card in engine_state.deck.peek(street)]
+            bot_state = bot_round_state(button, street, pips, stacks, hands, bounties, board, bot_state)
+        self.replayed = end
+        if not terminal:
+            self.bot_game_state, self.bot_round_state = game_state, bot_state
+            return self.pokerbot.get_action(game_state, bot_state, seat)
+        if history[end - HISTORY_STRIDE] != FOLD:
+            # the opponent's hand is revealed at showdown
+            hands = [[], []]
+            hands[seat] = bot_state.hands[seat]
+            hands[1-seat] = [CARD_NAMES[card] for card in engine_state.hands[1-seat]]
+            bot_state = bot_state._replace(hands=hands)
+        delta = round_state.deltas[seat]
+        deltas = [-delta, -delta]
+        deltas[seat] = delta
+        # only the winner's bounty hit is revealed, or both after a split pot
+        bounty_hits = list(round_state.bounty_hits)
+        if round_state.deltas[0] > 0:
+            bounty_hits[1] = False
+        elif round_state.deltas[1] > 0:
+            bounty_hits[0] = False
+        game_state = states.GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
+        self.pokerbot.handle_round_over(game_state, states.TerminalState(deltas, bounty_hits, bot_state), seat)
+        self.bot_game_state = states.GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
+        self.bot_round_state = None
+        self.round_flag = True
+        return None
+
+    def convert_action(self, bot_action, round_state, legal_actions, game_log):
+        '''
+        Converts the bot's own action into the engine's, or returns None if it is illegal.
+
+        Raises AttributeError, KeyError, TypeError or ValueError if it is not an action.
+        '''
+        action = DECODE[ACTION_CODES[type(bot_action).__name__]]
+        if action in legal_actions:
+            if action is RaiseAction:
+                amount = int(bot_action.amount)
+                min_raise, max_raise = round_state.raise_bounds()
+                if min_raise <= amount <= max_raise:
+                    return action(amount)
+            else:
+                return action()
+        game_log.append(self.name + ' attempted illegal ' + action.__name__)
+        return None
+
+
+def always_call(round_state, rng):
+    '''
+    Reference policy: calls every bet and checks otherwise.
+    '''
+    return CallAction() if CallAction in round_state.legal_actions() else CheckAction()
+
+
+def random_legal(round_state, rng):
+    '''
+    Reference policy: picks a legal action uniformly, and a raise amount uniformly within the bounds.
+    '''
+    legal_actions = round_state.legal_actions()
+    # a fixed order, since set order would differ between runs
+    action = rng.choice([action for action in (FoldAction, CallAction, CheckAction, RaiseAction)
+                         if action in legal_actions])
+    if action is RaiseAction:
+        min_raise, max_raise = round_state.raise_bounds()
+        return RaiseAction(rng.randint(min_raise, max_raise))
+    return action()
+
+
+def estimate_equity(hand, board, rng, samples):
+    '''
+    Estimates the chance that hand beats a random hand once the board is complete, counting ties as half.
+    '''
+    dead = set(hand) | set(board)
+    deck = [card for card in CARDS if card not in dead]
+    num_drawn = 2 + 5 - len(board)
+    wins = 0.
+    for _ in range(samples):
+        drawn = rng.sample(deck, num_drawn)
+        full_board = board + drawn[2:]
+        score = eval7.evaluate(hand + full_board)
+        opponent_score = eval7.evaluate(drawn[:2] + full_board)
+        wins += 1. if score > opponent_score else 0.5 if score == opponent_score else 0.
+    return wins / samples
+
+
+def equity_threshold(round_state, rng):
+    '''
+    Reference policy: raises the minimum with a sampled equity above EQUITY_RAISE_THRESHOLD,
+    continues while the equity covers the pot odds, and otherwise checks or folds.
+    '''
+    active = round_state.button % 2
+    legal_actions = round_state.legal_actions()
+    board = round_state.deck.peek(round_state.street) if round_state.street else []
+    equity = estimate_equity(round_state.hands[active], board, rng, EQUITY_SAMPLES)
+    if equity > EQUITY_RAISE_THRESHOLD and RaiseAction in legal_actions:
+        return RaiseAction(round_state.raise_bounds()[0])
+    continue_cost = round_state.pips[1-active] - round_state.pips[active]
+    if continue_cost == 0:
+        return CheckAction()
+    pot = 2 * STARTING_STACK - round_state.stacks[0] - round_state.stacks[1]
+    return CallAction() if equity >= continue_cost / (pot + continue_cost) else FoldAction()
+
+
+# built-in reference policies for PolicyPlayer, by name
+POLICIES = {'call': always_call, 'random': random_legal, 'equity': equity_threshold}
+EQUITY_SAMPLES = 16
+EQUITY_RAISE_THRESHOLD = 0.7
+
+
+class PolicyPlayer(Player):
+    '''
+    Plays one of the built-in reference POLICIES inside the engine.
+
+    There is no bot, subprocess or socket behind it and no game clock is charged,
+    so a match between two PolicyPlayers measures the engine's own overhead.
+    '''
+
+    def __init__(self, name, policy, seed=None):
+        super().__init__(name, '.', os.devnull)
+        self.policy = POLICIES[policy]
+        self.rng = random.Random(seed)
+
+    def build(self):
+        '''
+        Reference policies need no build.
+        '''
+
+    def run(self):
+        '''
+        Reference policies need no connection.
+        '''
+
+    def new_match(self):
+        '''
+        Resets the bankroll and game clock.
+        '''
+        self.reset()
+
+    def write_log(self):
+        '''
+        Reference policies print nothing.
+        '''
+
+    def stop(self):
+        '''
+        Reference policies have nothing to stop.
+        '''
+
+    def query(self, round_state, player_message, game_log):
+        '''
+        Drops the message, as the socket would send it, and returns the policy's action.
+        '''
+        player_message.clear()
+        if isinstance(round_state, RoundState):
+            return self.policy(round_state, self.rng)
+        return CheckAction()
+
+
+class GameLog():
+    '''
+    Streams the game log to disk, flushing every flush_rounds rounds.
+
+    level 'full' records every action; 'results' skips the per-action text and
+    keeps only round headers, bounty resets, awards and errors. compression may
+    be None, 'gzip' or 'lzma'. Game.log is append-only, like the list it replaces.
+    '''
+    OPENERS = {None: (open, '.txt'), 'gzip': (gzip.open, '.txt.gz'), 'lzma': (lzma.open, '.txt.xz')}
+
+    def __init__(self, name, level, compression, flush_rounds):
+        if level not in ('full', 'results'):
+            raise ValueError('unknown game log level ' + str(level))
+        self.opener, extension = GameLog.OPENERS[compression]
+        self.filename = name + extension
+        self.detailed = level == 'full'
+        self.flush_rounds = max(1, flush_rounds)
+        self.rounds = 0
+        self.lines = []
+        self.log_file = None
+        self.mode = 'wt'
+        self.separator = ''
+
+    def append(self, line):
+        '''
+        Buffers one line of the game log.
+        '''
+        self.lines.append(line)
+
+    def end_round(self):
+        '''
+        Marks the end of a round and flushes if enough rounds are buffered.
+        '''
+        self.rounds += 1
+        if self.rounds % self.flush_rounds == 0:
+            self.flush()
+
+    def flush_due(self):
+        '''
+        Returns whether the next end_round writes to disk.
+        '''
+        return (self.rounds + 1) % self.flush_rounds == 0
+
+    def flush(self):
+        '''
+        Writes the buffered lines, opening the file on first use.
+        '''
+        if self.log_file is None:
+            self.log_file = self.opener(self.filename, self.mode)
+        if self.lines:
+            self.log_file.write(self.separator + '\n'.join(self.lines))
+            self.log_file.flush()
+            self.separator = '\n'
+            self.lines.clear()
+
+    def checkpoint(self):
+        '''
+        Writes the buffered lines and closes the file, so that even a compressed
+        log ends in a complete stream, forces it to disk and returns its size.
+        Later lines are appended, in a new stream.
+        '''
+        self.flush()
+        self.log_file.close()
+        self.log_file = None
+        self.mode = 'at'
+        fd = os.open(self.filename, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return os.path.getsize(self.filename)
+
+    def resume(self, size):
+        '''
+        Cuts the file back to a size checkpoint returned, and appends from there.
+        '''
+        os.truncate(self.filename, size)
+        self.mode = 'at'
+        self.separator = '\n'
+
+    def close(self):
+        '''
+        Writes the remaining lines and closes the file.
+        '''
+        self.flush()
+        self.log_file.close()
+
+
+def for_each_player(players, method):
+    '''
+    Calls the named method of every player and waits for all of them, in parallel
+    threads when every player is thread safe. Re-raises the first error.
+    '''
+    if all(player.thread_safe for player in players):
+        with ThreadPoolExecutor(len(players)) as executor:
+            for future in [executor.submit(getattr(player, method)) for player in players]:
+                future.result()
+    else:
+        for player in players:
+            getattr(player, method)()
+
 
 class Game():
     '''
     Manages logging and the high-level game procedure.
     '''
 
-    def __init__(self):
-        self.log = ['6.9630 MIT Pokerbots - ' + PLAYER_1_NAME + ' vs ' + PLAYER_2_NAME]
-        self.player_messages = [[], []]
+    def __init__(self, seed=None, schedule=None, output_dir='', match_id=None):
+        self.output_dir = output_dir
+        self.match_id = match_id
+        self.log = GameLog(os.path.join(output_dir, GAME_LOG_FILENAME), GAME_LOG_LEVEL,
+                           GAME_LOG_COMPRESSION, GAME_LOG_FLUSH_ROUNDS)
+        # the clauses of the round both players are sent, see PlayerMessage
+        self.public_clauses = bytearray()
+        self.player_messages = [PlayerMessage(self.public_clauses), PlayerMessage(self.public_clauses)]
+        self.folded = False
+        self.hand_history = None
+        self.ev_bankrolls = None
+        # wall seconds to start and stop both players, and each player's own phases
+        self.timings = {}
+        # each player's CPU time, peak memory and context switches beside the clock it used
+        self.resources = {}
+        # rows for RESULTS_DATABASE, inserted in batches as the game log is flushed
+        self.round_rows = []
+        self.results_id = None  # the match's row in RESULTS_DATABASE, once its first batch is in
+        self.round_start = 0.
+        self.start_time = 0.
+        self.match_players = None
+        self.round_num = 0
+        # publishes live events to EVENT_FEED, see event_feed.py
+        self.feed = None
+        # cards and bounties come only from the deal schedule, so two games with the
+        # same seed or schedule deal the same cards to the same seats in the same rounds
+        self.seed = GAME_SEED if seed is None else seed
+        self.schedule = schedule
 
     def log_round_state(self, players, round_state):
         '''
         Incorporates RoundState information into the game log and player messages.
         '''
         if round_state.street == 0 and round_state.button == 0:
-            self.log.append('{} posts the blind of {}'.format(players[0].name, SMALL_BLIND))
-            self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
-            self.log.append('{} dealt {}'.format(players[0].name, PCARDS(round_state.hands[0])))
-            self.log.append('{} dealt {}'.format(players[1].name, PCARDS(round_state.hands[1])))
-            self.player_messages[0] = ['T0.', 'P0', 'H' + CCARDS(round_state.hands[0]), 'G' + round_state.bounties[0]]
-            self.player_messages[1] = ['T0.', 'P1', 'H' + CCARDS(round_state.hands[1]), 'G' + round_state.bounties[1]]
+            hands = round_state.hands
+            if self.log.detailed:
+                self.log.append('{} posts the blind of {}'.format(players[0].name, SMALL_BLIND))
+                self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
+                self.log.append('{} dealt {}'.format(players[0].name, PCARDS(hands[0])))
+                self.log.append('{} dealt {}'.format(players[1].name, PCARDS(hands[1])))
+            bounties = round_state.bounties
+            # a bot out of time is sent nothing more, so nothing is kept for it
+            self.player_messages[0].start_round(0, b' P0 H%s G%s' % (BCARDS(hands[0]), bounties[0].encode()),
+                                                DEFER_ROUND_OVER and players[0].game_clock > 0.)
+            self.player_messages[1].start_round(1, b' P1 H%s G%s' % (BCARDS(hands[1]), bounties[1].encode()),
+                                                DEFER_ROUND_OVER and players[1].game_clock > 0.)
+            del self.public_clauses[:]
+            if self.feed is not None:
+                self.feed.publish('round_start', round=self.round_num, players=[player.name for player in players],
+                                  bankrolls=[player.bankroll for player in players],
+                                  hands=[JCARDS(hand) for hand in hands], bounties=bounties)
         elif round_state.street > 0 and round_state.button == 1:
             board = round_state.deck.peek(round_state.street)
-            self.log.append(STREET_NAMES[round_state.street - 3] + ' ' + PCARDS(board) +
-                            PVALUE(players[0].name, STARTING_STACK-round_state.stacks[0]) +
-                            PVALUE(players[1].name, STARTING_STACK-round_state.stacks[1]))
-            self.log.append(f"Current stacks: {round_state.stacks[0]}, {round_state.stacks[1]}")
-            compressed_board = 'B' + CCARDS(board)
-            self.player_messages[0].append(compressed_board)
-            self.player_messages[1].append(compressed_board)
+            if self.log.detailed:
+                self.log.append(STREET_NAMES[round_state.street - 3] + ' ' + PCARDS(board) +
+                                PVALUE(players[0].name, STARTING_STACK-round_state.stacks[0]) +
+                                PVALUE(players[1].name, STARTING_STACK-round_state.stacks[1]))
+                self.log.append(f"Current stacks: {round_state.stacks[0]}, {round_state.stacks[1]}")
+            self.public_clauses += b' B' + BCARDS(board)
+            if self.feed is not None:
+                self.feed.publish('street', round=self.round_num, street=round_state.street, board=JCARDS(board),
+                                  pips=round_state.pips, stacks=round_state.stacks)
 
     def log_action(self, name, action, bet_override):
         '''
         Incorporates action information into the game log and player messages.
         '''
-        if isinstance(action, FoldAction):
+        self.folded = isinstance(action, FoldAction)
+        if self.folded:
             phrasing = ' folds'
-            code = 'F'
+            code = b' F'
         elif isinstance(action, CallAction):
             phrasing = ' calls'
-            code = 'C'
+            code = b' C'
         elif isinstance(action, CheckAction):
             phrasing = ' checks'
-            code = 'K'
+            code = b' K'
         else:  # isinstance(action, RaiseAction)
             phrasing = (' bets ' if bet_override else ' raises to ') + str(action.amount)
-            code = 'R' + str(action.amount)
-        self.log.append(name + phrasing)
-        self.player_messages[0].append(code)
-        self.player_messages[1].append(code)
+            code = b' R%d' % action.amount
+        if self.log.detailed:
+            self.log.append(name + phrasing)
+        self.public_clauses += code
+        if self.feed is not None:
+            self.feed.publish('action', round=self.round_num, player=name, action=code[1:2].decode(),
+                              amount=getattr(action, 'amount', None))
 
     def log_terminal_state(self, players, round_state):
         '''
         Incorporates TerminalState information into the game log and player messages.
         '''
         previous_state = round_state.previous_state
-        if not self.log[-1].endswith(' folds'):
-            self.log.append('{} shows {}'.format(players[0].name, PCARDS(previous_state.hands[0])))
-            self.log.append('{} shows {}'.format(players[1].name, PCARDS(previous_state.hands[1])))
-            self.player_messages[0].append('O' + CCARDS(previous_state.hands[1]))
-            self.player_messages[1].append('O' + CCARDS(previous_state.hands[0]))
+        if not self.folded:
+            if self.log.detailed:
+                self.log.append('{} shows {}'.format(players[0].name, PCARDS(previous_state.hands[0])))
+                self.log.append('{} shows {}'.format(players[1].name, PCARDS(previous_state.hands[1])))
+            self.player_messages[0].tail += b' O' + BCARDS(previous_state.hands[1])
+            self.player_messages[1].tail += b' O' + BCARDS(previous_state.hands[0])
+            if self.feed is not None:
+                self.feed.publish('showdown', round=self.round_num, hands=[JCARDS(hand) for hand in previous_state.hands])
         self.log.append('{} awarded {}'.format(players[0].name, round_state.deltas[0]))
         self.log.append('{} awarded {}'.format(players[1].name, round_state.deltas[1]))
-        self.player_messages[0].append('D' + str(round_state.deltas[0]))
-        self.player_messages[1].append('D' + str(round_state.deltas[1]))
+        self.player_messages[0].tail += b' D%d' % round_state.deltas[0]
+        self.player_messages[1].tail += b' D%d' % round_state.deltas[1]
 
         # figure out win/chop, bounty hit, and update logs accordingly
         # if round_state.bounty_hits[0]:
@@ -513,35 +1578,71 @@ class Game():
             hit_chars[1] = '#'
         elif round_state.deltas[1] > 0:
             hit_chars[0] = '#'
-        self.player_messages[0].append('Y' + hit_chars[0] + hit_chars[1])
-        self.player_messages[1].append('Y' + hit_chars[1] + hit_chars[0])
+        self.player_messages[0].tail += (' Y' + hit_chars[0] + hit_chars[1]).encode()
+        self.player_messages[1].tail += (' Y' + hit_chars[1] + hit_chars[0]).encode()
+        if self.feed is not None:
+            self.feed.publish('round_end', round=self.round_num, deltas=round_state.deltas,
+                              bounty_hits=round_state.bounty_hits)
 
-    def run_round(self, players, bounties):
+    def run_round(self, players, bounties, round_num):
         '''
         Runs one round of poker.
         '''
-        deck = eval7.Deck()
-        deck.shuffle()
-        hands = [deck.deal(2), deck.deal(2)]
+        hands, deck = self.schedule.deal(round_num)
         pips = [SMALL_BLIND, BIG_BLIND]
         stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-        round_state = RoundState(0, 0, pips, stacks, hands, deck, bounties, None)
-        while not isinstance(round_state, TerminalState):
+        round_state = RoundState(0, 0, pips, stacks, hands, deck, bounties)
+        terminal_state = None
+        while terminal_state is None:
             self.log_round_state(players, round_state)
             active = round_state.button % 2
             player = players[active]
             action = player.query(round_state, self.player_messages[active], self.log)
             bet_override = (round_state.pips == [0, 0])
             self.log_action(player.name, action, bet_override)
-            round_state = round_state.proceed(action)
-        self.log_terminal_state(players, round_state)
-        for player, player_message, delta in zip(players, self.player_messages, round_state.deltas):
-            player.query(round_state, player_message, self.log)
+            terminal_state = round_state.apply(action)
+        self.log_terminal_state(players, terminal_state)
+        self.send_round_over(players, terminal_state)
+        for player, delta, ev_delta in zip(players, terminal_state.deltas, terminal_state.ev_deltas):
             player.bankroll += delta
+            player.ev_bankroll += ev_delta
+        self.record_round(round_num, hands, deck, bounties, terminal_state)
+        return terminal_state
 
-    def run(self):
+    def send_round_over(self, players, terminal_state, deferred=False):
         '''
-        Runs one game of poker.
+        Sends both players the results of a round, and waits for each to acknowledge them.
+
+        With DEFER_ROUND_OVER the players that defer them are sent them only with
+        deferred, after the last round; the next round's first message carries them otherwise.
+        '''
+        for player, player_message in zip(players, self.player_messages):
+            if deferred == (DEFER_ROUND_OVER and player.defers_round_over):
+                player.query(terminal_state, player_message, self.log)
+
+    def record_round(self, round_num, hands, deck, bounties, terminal_state):
+        '''
+        Adds a finished round to the hand history, if one is being written.
+        '''
+        if self.hand_history is not None:
+            # players swap seats every round, so the first player sits in seat 0 in odd rounds
+            self.hand_history.write_round(round_num, (round_num - 1) % 2, hands, deck.cards, bounties,
+                                          terminal_state, not self.folded, terminal_state.previous_state.actions())
+        if RESULTS_DATABASE is not None:
+            # the seat of the first player, who sits in seat 0 in odd rounds
+            seat = (round_num - 1) % 2
+            self.round_rows.append((round_num, seat, terminal_state.previous_state.street,
+                                    terminal_state.deltas[seat], terminal_state.ev_deltas[seat],
+                                    bounties[seat], bounties[1 - seat], int(terminal_state.bounty_hits[seat]),
+                                    int(terminal_state.bounty_hits[1 - seat]), int(not self.folded),
+                                    time.perf_counter() - self.round_start))
+
+    def start(self, players, resume=None):
+        '''
+        Prints the banner and prepares the deal schedule and hand history of a game.
+
+        players defaults to the PLAYER_1 and PLAYER_2 of the config. With resume,
+        a checkpoint, the game log and hand history continue from it. Returns the players.
         '''
         print('   __  _____________  ___       __           __        __    ')
         print('  /  |/  /  _/_  __/ / _ \\___  / /_____ ____/ /  ___  / /____')
@@ -549,35 +1650,423 @@ class Game():
         print('/_/  /_/___/ /_/   /_/   \\___/_/\\_\\\\__/_/ /_.__/\\___/\\__/___/')
         print()
         print('Starting the Pokerbots engine...')
-        players = [
-            Player("New", "best_bot"),
-            Player("Best", "best_bot")
-        ]
-        bounties = [-1, -1]
+        if players is None:
+            player_class = InProcessPlayer if IN_PROCESS_BOTS else Player
+            players = [player_class(PLAYER_1_NAME, PLAYER_1_PATH), player_class(PLAYER_2_NAME, PLAYER_2_PATH)]
+        if resume is None:
+            self.log.append('6.9630 MIT Pokerbots - ' + players[0].name + ' vs ' + players[1].name)
+        else:
+            self.log.resume(resume['log_size'])
+        if self.seed is None and CHECKPOINT_FILENAME is not None:
+            self.seed = random.getrandbits(64)  # a resumed match has to deal the same cards
+        if self.schedule is None:
+            self.schedule = load_or_generate(DEAL_SCHEDULE_FILENAME, self.seed, NUM_ROUNDS)
+        if self.schedule.num_rounds < NUM_ROUNDS:
+            raise ValueError('deal schedule has only {} rounds'.format(self.schedule.num_rounds))
+        if HAND_HISTORY_FILENAME is not None:
+            self.hand_history = HandHistoryWriter(os.path.join(self.output_dir, HAND_HISTORY_FILENAME),
+                                                  [player.name for player in players],
+                                                  None if resume is None else resume['hand_history_sizes'])
+        self.match_players = [(player.name, player.path) for player in players]
+        self.start_time = time.time() if resume is None else resume['started']
+        if EVENT_FEED is not None:
+            self.feed = EventFeed(EVENT_FEED, self.match_id or str(os.getpid()))
+            self.feed.publish('match_start', players=[player.name for player in players], seed=self.seed)
+        return players
+
+    def checkpoint_path(self):
+        '''
+        Returns the path of the checkpoint file, or None if checkpoints are off.
+        '''
+        if CHECKPOINT_FILENAME is None:
+            return None
+        return os.path.join(self.output_dir, CHECKPOINT_FILENAME + '.json')
+
+    def checkpoint(self, players, bounties, round_num):
+        '''
+        Saves everything needed to continue the match from round_num, where players
+        and bounties are as round_num starts with them.
+
+        The game log and hand history are forced to disk first, and only their
+        sizes saved, and the round rows are added to RESULTS_DATABASE, so the
+        checkpoint is small however long the match. It replaces the last one atomically, so a
+        crash at any point leaves a checkpoint that matches the files.
+        '''
+        path = self.checkpoint_path()
+        if RESULTS_DATABASE is not None:
+            self.record_rounds(players)
+        first, second = players if round_num % 2 == 1 else players[::-1]
+        checkpoint = {
+            'round_num': round_num,
+            'match_id': self.match_id,
+            'seed': self.seed,
+            'started': self.start_time,
+            'config': match_spec.config_snapshot(globals()),
+            # in the order the match started with, which is the seat order of odd rounds
+            'players': [{'name': player.name, 'bankroll': player.bankroll, 'ev_bankroll': player.ev_bankroll,
+                         'game_clock': player.game_clock} for player in (first, second)],
+            'bounties': bounties if round_num % 2 == 1 else bounties[::-1],
+            'log_size': self.log.checkpoint(),
+            'hand_history_sizes': None if self.hand_history is None else self.hand_history.checkpoint(),
+            'results_id': self.results_id,
+        }
+        with open(path + '.tmp', 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=4)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(path + '.tmp', path)
+
+    def restore(self, players, resume):
+        '''
+        Puts the bankrolls, game clocks and results row of a checkpoint back, and
+        returns the players and bounties in seat order for its round, and the round.
+        '''
+        if [player.name for player in players] != [saved['name'] for saved in resume['players']]:
+            raise ValueError('the checkpoint is of a match between ' +
+                             ' and '.join(saved['name'] for saved in resume['players']))
+        for player, saved in zip(players, resume['players']):
+            player.bankroll = saved['bankroll']
+            player.ev_bankroll = saved['ev_bankroll']
+            player.game_clock = saved['game_clock']
+        # the rounds played after the checkpoint are replaced as they are played again
+        self.results_id = resume['results_id']
+        round_num = resume['round_num']
+        bounties = resume['bounties']
+        if round_num % 2 == 0:
+            return players[::-1], bounties[::-1], round_num
+        return players, bounties, round_num
+
+    def start_round(self, players, bounties, round_num):
+        '''
+        Logs the round header and returns the bounties of the round.
+        '''
+        self.log.append('')
+        self.log.append('Round #' + str(round_num) + STATUS(players))
+        self.round_start = time.perf_counter()
+        self.round_num = round_num
+        if round_num % ROUNDS_PER_BOUNTY == 1:
+            bounties = self.schedule.bounties(round_num)
+            self.log.append(f"Bounties reset to {bounties[0]} for player {players[0].name} and {bounties[1]} for player {players[1].name}")
+        return bounties
+
+    def end_round(self, players):
+        '''
+        Logs the standings after a round.
+        '''
+        self.log.append('Winning counts at the end of the round: ' + STATUS(players))
+        flush = self.log.flush_due()
+        self.log.end_round()
+        if RESULTS_DATABASE is not None and flush:
+            self.record_rounds(players)
+        for player in players:
+            if player.latency is not None:
+                player.latency.end_round(player.game_clock)
+            # the last round is sampled while the bots still run, so the totals span the match
+            if player.resources is not None and (self.round_num % BOT_RESOURCES_ROUNDS == 0
+                                                 or self.round_num == NUM_ROUNDS):
+                player.resources.record(self.round_num)
+        if self.feed is not None:
+            self.feed.publish('clock', round=self.round_num, clocks={player.name: player.game_clock for player in players})
+
+    def finish(self, players):
+        '''
+        Closes the game's files once the players are stopped and returns the final
+        (name, bankroll) pairs in the order of the final status line.
+        '''
+        self.schedule.close()
+        if self.hand_history is not None:
+            self.hand_history.close()
         for player in players:
-            player.build()
-            player.run()
-        for round_num in range(1, NUM_ROUNDS + 1):
-            self.log.append('')
-            self.log.append('Round #' + str(round_num) + STATUS(players))
-            if round_num % ROUNDS_PER_BOUNTY == 1:
-                cardNames = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-                bounties = [cardNames[random.randint(0, 12)], cardNames[random.randint(0, 12)]]
-                self.log.append(f"Bounties reset to {bounties[0]} for player {players[0].name} and {bounties[1]} for player {players[1].name}")
-            self.run_round(players, bounties)
-            self.log.append('Winning counts at the end of the round: ' + STATUS(players))
+            if player.resources is not None:
+                self.resources[player.name] = player.resources.summary(STARTING_GAME_CLOCK - player.game_clock)
+        if LATENCY_FILENAME is not None:
+            with open(os.path.join(self.output_dir, LATENCY_FILENAME + '.json'), 'w') as latency_file:
+                # the per-round series stay here, out of the results tournaments collect
+                json.dump({player.name: dict(player.latency.summary(), resources=self.resources.get(player.name),
+                                             resource_rounds=None if player.resources is None
+                                             else player.resources.rounds())
+                           for player in players}, latency_file, indent=4)
+        print('Writing', self.log.filename)
+        self.log.close()
+        if self.feed is not None:
+            self.feed.publish('match_end', bankrolls={player.name: player.bankroll for player in players},
+                              dropped=self.feed.dropped)
+            self.feed.close()
+        self.ev_bankrolls = [(player.name, player.ev_bankroll) for player in players]
+        self.timings['players'] = {player.name: player.timings for player in players}
+        if RESULTS_DATABASE is not None:
+            self.record_match(players)
+        if CHECKPOINT_FILENAME is not None:
+            # a finished match is not resumed
+            if os.path.exists(self.checkpoint_path()):
+                os.remove(self.checkpoint_path())
+        return [(player.name, player.bankroll) for player in players]
+
+    def match_row(self, players, num_rounds):
+        '''
+        Returns the match's row for RESULTS_DATABASE, as it stands.
+        '''
+        (name0, path0), (name1, path1) = self.match_players
+        bankrolls = {player.name: player.bankroll for player in players}
+        ev_bankrolls = {player.name: player.ev_bankroll for player in players}
+        return {
+            'name': self.match_id, 'started': self.start_time, 'duration': time.time() - self.start_time,
+            'seed': None if self.seed is None else str(self.seed), 'num_rounds': num_rounds,
+            'player_0': name0, 'player_1': name1, 'path_0': path0, 'path_1': path1,
+            'bankroll_0': bankrolls[name0], 'bankroll_1': bankrolls[name1],
+            'ev_bankroll_0': ev_bankrolls[name0], 'ev_bankroll_1': ev_bankrolls[name1],
+        }
+
+    def record_rounds(self, players):
+        '''
+        Adds the rounds played since the last batch to RESULTS_DATABASE, with the
+        match's row, unfinished, before the first batch. Rows that cannot be added
+        are kept for the next batch.
+        '''
+        if not self.round_rows:
+            return
+        try:
+            self.results_id = record_rounds(RESULTS_DATABASE, self.match_row(players, 0),
+                                            self.round_rows, self.results_id)
+        except sqlite3.Error as error:
+            print('Could not record rounds in', RESULTS_DATABASE, '-', error)
+            return
+        self.round_rows = []
+
+    def record_match(self, players):
+        '''
+        Adds the finished match and its last rounds to RESULTS_DATABASE.
+        '''
+        try:
+            record_match(RESULTS_DATABASE, self.match_row(players, self.round_num),
+                         self.round_rows, self.results_id)
+        except sqlite3.Error as error:
+            print('Could not record the match in', RESULTS_DATABASE, '-', error)
+        self.round_rows = []
+        self.results_id = None
+
+    def run(self, players=None, keep_alive=False, resume=None):
+        '''
+        Runs one game of poker.
+
+        players defaults to the PLAYER_1 and PLAYER_2 of the config. Players that already played a match
+        are reused instead of rebuilt. With keep_alive the bots are left running
+        for another match instead of being stopped. With resume, a checkpoint, the
+        match continues from it with freshly started bots. Returns the final (name, bankroll)
+        pairs in the order of the final status line.
+        '''
+        players = self.start(players, resume)
+        bounties = [-1, -1]
+        first_round = 1
+        if resume is not None:
+            players, bounties, first_round = self.restore(players, resume)
+        start_time = time.perf_counter()
+        for_each_player(players, 'start_match')
+        self.timings['setup'] = time.perf_counter() - start_time
+        for round_num in range(first_round, NUM_ROUNDS + 1):
+            bounties = self.start_round(players, bounties, round_num)
+            terminal_state = self.run_round(players, bounties, round_num)
+            self.end_round(players)
 
             players = players[::-1]
             bounties = bounties[::-1]
+            # messages follow their players, for the clauses DEFER_ROUND_OVER keeps
+            self.player_messages.reverse()
+            if CHECKPOINT_FILENAME is not None and round_num % CHECKPOINT_ROUNDS == 0 and round_num < NUM_ROUNDS:
+                self.checkpoint(players, bounties, round_num + 1)
+        if DEFER_ROUND_OVER and NUM_ROUNDS > 0:
+            # the last round has no next round to send its results with
+            self.send_round_over(players, terminal_state, deferred=True)
         self.log.append('')
-        self.log.append('Final' + STATUS(players))
-        for player in players:
-            player.stop()
-        name = GAME_LOG_FILENAME + '.txt'
-        print('Writing', name)
-        with open(name, 'w') as log_file:
-            log_file.write('\n'.join(self.log))
+        self.log.append('Final' + STATUS(players) + (' | All-in EV' + EV_STATUS(players) if ALL_IN_EV else ''))
+        start_time = time.perf_counter()
+        for_each_player(players, 'write_log' if keep_alive else 'stop')
+        self.timings['teardown'] = time.perf_counter() - start_time
+        return self.finish(players)
+
+def _timed(function, section, totals):
+    '''
+    Wraps function so that the time spent in it is added to totals[section].
+    '''
+    def timed(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[section] += time.perf_counter() - start_time
+    return timed
+
+
+# the engine methods benchmark times, by section; times include the calls they make
+BENCHMARK_SECTIONS = {
+    'apply': [(RoundState, 'apply')],
+    'get_delta': [(RoundState, 'get_delta')],
+    'showdown': [(RoundState, 'showdown')],
+    'logging': [(Game, 'log_round_state'), (Game, 'log_action'), (Game, 'log_terminal_state'),
+                (GameLog, 'end_round'), (GameLog, 'close')],
+    'policies': [(PolicyPlayer, 'query')],
+}
+
+
+def _benchmark_match(policies, num_rounds, seed, output_dir):
+    '''
+    Plays one headless match between two PolicyPlayers and returns its duration.
+    '''
+    global NUM_ROUNDS, RESULTS_DATABASE, EVENT_FEED, CHECKPOINT_FILENAME
+    saved = NUM_ROUNDS, RESULTS_DATABASE, EVENT_FEED, CHECKPOINT_FILENAME
+    NUM_ROUNDS = num_rounds
+    # benchmark matches are not recorded, published or checkpointed
+    RESULTS_DATABASE = EVENT_FEED = CHECKPOINT_FILENAME = None
+    players = [PolicyPlayer('Policy{}_{}'.format(i + 1, policy), policy, seed + i) for i, policy in enumerate(policies)]
+    try:
+        with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+            start_time = time.perf_counter()
+            Game(seed, output_dir=output_dir).run(players)
+            return time.perf_counter() - start_time
+    finally:
+        NUM_ROUNDS, RESULTS_DATABASE, EVENT_FEED, CHECKPOINT_FILENAME = saved
+
+
+def benchmark(policies=('random', 'random'), num_rounds=10000, seed=0):
+    '''
+    Measures the engine alone, playing num_rounds rounds between two built-in reference policies.
+
+    The same match is played three times: once untouched for throughput, once
+    with BENCHMARK_SECTIONS timed, and once under tracemalloc for memory. Python
+    does not count allocations, so memory is reported as the peak traced bytes
+    allocated within a round, above what was live when it started, and the memory
+    blocks still held per round afterwards. Logs go to a temporary directory.
+    '''
+    output_dir = tempfile.mkdtemp(prefix='pokerbots')
+    try:
+        duration = _benchmark_match(policies, num_rounds, seed, output_dir)
+
+        totals = dict.fromkeys(BENCHMARK_SECTIONS, 0.)
+        originals = [(owner, name, getattr(owner, name)) for targets in BENCHMARK_SECTIONS.values()
+                     for owner, name in targets]
+        for section, targets in BENCHMARK_SECTIONS.items():
+            for owner, name in targets:
+                setattr(owner, name, _timed(getattr(owner, name), section, totals))
+        try:
+            timed_duration = _benchmark_match(policies, num_rounds, seed, output_dir)
+        finally:
+            for owner, name, function in originals:
+                setattr(owner, name, function)
+
+        round_peaks = []
+        round_start = [0]  # traced bytes live when the current round started
+        end_round = Game.end_round
+
+        def traced_end_round(game, players):
+            end_round(game, players)
+            current, peak = tracemalloc.get_traced_memory()
+            round_peaks.append(peak - round_start[0])
+            round_start[0] = current
+            tracemalloc.reset_peak()
+        Game.end_round = traced_end_round
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            _benchmark_match(policies, num_rounds, seed, output_dir)
+        finally:
+            tracemalloc.stop()
+            Game.end_round = end_round
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        'policies': list(policies),
+        'rounds': num_rounds,
+        'rounds_per_second': num_rounds / duration,
+        'seconds': duration,
+        'sections': {section: {'seconds': seconds, 'share': seconds / timed_duration}
+                     for section, seconds in totals.items()},
+        'peak_bytes_per_round': sum(round_peaks) / len(round_peaks) if round_peaks else 0,
+        'blocks_held_per_round': blocks / num_rounds,
+    }
+
+
+def parse_args():
+    '''
+    Parses engine command line arguments.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 engine.py')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Time the engine alone, playing two built-in reference policies headless')
+    parser.add_argument('--rounds', type=int, default=10000, help='Rounds to play in benchmark mode')
+    parser.add_argument('--policies', nargs=2, default=['random', 'random'], choices=sorted(POLICIES),
+                        help='The reference policies to play in benchmark mode')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seeds the deals, and the policies in benchmark mode, defaults to GAME_SEED or 0')
+    parser.add_argument('--spec', type=str, default=None, metavar='FILE',
+                        help='Read the players, seed and config overrides of the match from a JSON or TOML file')
+    parser.add_argument('--player', action='append', default=[], metavar='NAME=PATH',
+                        help='A player of the match, given twice, instead of PLAYER_1 and PLAYER_2')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override a config.py parameter for this match')
+    parser.add_argument('--resume', nargs='?', const='', default=None, metavar='CHECKPOINT',
+                        help='Continue the match saved in CHECKPOINT, with its config, restarting both bots; '
+                             'CHECKPOINT defaults to CHECKPOINT_FILENAME')
+    return parser.parse_args()
+
+
+def set_config(overrides):
+    '''
+    Replaces config.py parameters for the matches of this process.
+
+    Raises KeyError for an override that is not a config.py parameter, so that a
+    misspelt one fails instead of setting a name nothing reads.
+    '''
+    match_spec.check_overrides(overrides)
+    globals().update(overrides)
+
+
+def main():
+    '''
+    Plays a match, resumes one from its checkpoint or benchmarks the engine,
+    as the command line asks.
+    '''
+    args = parse_args()
+    try:
+        # the command line overrides the spec file, which overrides config.py
+        spec = {'players': None, 'seed': None, 'overrides': {}}
+        if args.spec is not None:
+            spec = match_spec.load_match(args.spec)
+        overrides = spec['overrides']
+        players = [match_spec.parse_player(player) for player in args.player] or spec['players']
+        if players is not None:
+            overrides.update(match_spec.player_overrides(players))
+        overrides.update(match_spec.parse_assignments(args.set))
+        set_config(overrides)
+    except KeyError as error:
+        print(error.args[0])
+        sys.exit(1)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    seed = spec['seed'] if args.seed is None else args.seed
+    if args.benchmark:
+        print(json.dumps(benchmark(args.policies, args.rounds, seed or 0), indent=4))
+    elif args.resume is not None:
+        checkpoint_path = args.resume or CHECKPOINT_FILENAME or ''
+        if not checkpoint_path.endswith('.json'):
+            checkpoint_path += '.json'
+        if not os.path.exists(checkpoint_path):
+            print('No checkpoint to resume - pass its path to --resume or set CHECKPOINT_FILENAME')
+            sys.exit(1)
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        try:
+            set_config(checkpoint['config'])
+        except KeyError as error:
+            print('Cannot resume', checkpoint_path, '-', error.args[0])
+            sys.exit(1)
+        # the resumed match goes on checkpointing to the file it was resumed from
+        set_config({'CHECKPOINT_FILENAME': checkpoint_path[:-len('.json')]})
+        Game(checkpoint['seed'], match_id=checkpoint['match_id']).run(resume=checkpoint)
+    else:
+        Game(seed).run()
 
 
 if __name__ == '__main__':
-    Game().run()
+    main()
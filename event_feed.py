@@ -0,0 +1,143 @@
+'''
+A live feed of match events as JSON lines, for dashboards.
+
+The engine sends every event as one line to EVENT_FEED, either a Unix datagram
+socket that the dashboard binds or a FIFO it reads. Both keep each line whole
+however many engines send to them at once. Sending never blocks: events are
+dropped, and counted, while nothing is listening or the reader falls behind,
+so watching a match cannot slow it down.
+
+Every event has "event", "match" (the match id, or the engine's pid) and "time"
+(seconds since the epoch). The events of a match are:
+
+    match_start: players, seed
+    round_start: round, players and bankrolls, hands and bounties in seat order
+    street: round, street (3, 4 or 5), board, pips and stacks in seat order
+    action: round, player, action (F, C, K or R), amount (null but for raises)
+    showdown: round, hands in seat order
+    round_end: round, deltas and bounty_hits in seat order
+    clock: round, game clock left by player name
+    match_end: bankrolls by player name, events dropped
+
+usage: python3 event_feed.py PATH
+binds a datagram socket at PATH, or reads the FIFO at PATH, and prints every event it receives
+'''
+import socket
+import json
+import stat
+import time
+import sys
+import os
+
+# a FIFO writes this much at most in one piece, so longer lines could interleave
+PIPE_BUF = 4096
+RETRY_SECONDS = 1.  # how often a closed feed looks for its reader again
+
+
+class EventFeed():
+    '''
+    Publishes one match's events to a Unix datagram socket or FIFO without blocking.
+    '''
+
+    def __init__(self, path, match):
+        self.path = path
+        self.match = match
+        self.sock = None
+        self.fifo = None
+        self.dropped = 0
+        self.retry_time = 0.
+
+    def connect(self):
+        '''
+        Opens the feed if its reader is there, returning whether it is open.
+        '''
+        if self.sock is not None or self.fifo is not None:
+            return True
+        now = time.monotonic()
+        if now < self.retry_time:
+            return False
+        self.retry_time = now + RETRY_SECONDS
+        try:
+            mode = os.stat(self.path).st_mode
+            if stat.S_ISFIFO(mode):
+                # fails with ENXIO while no reader has the FIFO open
+                self.fifo = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            elif stat.S_ISSOCK(mode):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                try:
+                    sock.connect(self.path)
+                except OSError:
+                    sock.close()
+                    raise
+                self.sock = sock
+        except OSError:
+            return False
+        return self.sock is not None or self.fifo is not None
+
+    def publish(self, event, **fields):
+        '''
+        Sends one event, or drops it if the feed is closed or full.
+        '''
+        if not self.connect():
+            self.dropped += 1
+            return
+        fields['event'] = event
+        fields['match'] = self.match
+        fields['time'] = time.time()
+        line = (json.dumps(fields, separators=(',', ':')) + '\n').encode()
+        try:
+            if self.sock is not None:
+                self.sock.send(line)
+            elif len(line) <= PIPE_BUF:
+                os.write(self.fifo, line)
+            else:
+                self.dropped += 1
+        except BlockingIOError:
+            self.dropped += 1
+        except OSError:
+            # the reader went away; look for it again with the next event
+            self.dropped += 1
+            self.close()
+
+    def close(self):
+        '''
+        Closes the feed.
+        '''
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.fifo is not None:
+            os.close(self.fifo)
+            self.fifo = None
+
+
+def listen(path):
+    '''
+    Prints every event sent to path, a FIFO or a datagram socket bound here, until interrupted.
+    '''
+    if os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode):
+        while True:
+            # reopened whenever every engine has closed it
+            with open(path) as fifo:
+                for line in fifo:
+                    print(line, end='', flush=True)
+    if os.path.exists(path):
+        os.remove(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(path)
+        try:
+            while True:
+                print(sock.recv(65536).decode(), end='', flush=True)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python3 event_feed.py PATH')
+        sys.exit(1)
+    try:
+        listen(sys.argv[1])
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,174 @@
+'''
+Compact binary hand histories with a random-access round index.
+
+A hand history is two files. The data file holds a header with the player
+names, then for every round a fixed-width round record followed by that round's
+action stream. The index file holds one little-endian 8-byte offset into the
+data file per round, so any round can be found without reading the others.
+
+Seats are recorded as dealt: seat 0 is the small blind. Each round record
+names the player (0 or 1, in the order the players were given) who sat in
+seat 0, so per-player results can be recovered with no text parsing.
+'''
+from collections import namedtuple
+import struct
+import mmap
+import sys
+import os
+from deal_schedule import CARDS, RANKS
+
+MAGIC = b'PBHH'
+VERSION = 1
+HEADER = struct.Struct('<4sIHH')  # magic, version, name lengths
+# round number, player in seat 0, hole cards, board, bounty ranks, final street,
+# seat 0 delta, flags, number of actions; cards and ranks are in seat order
+ROUND = struct.Struct('<IB4s5s2sBiBH')
+ACTION = struct.Struct('<BH')  # action code, raise amount
+INDEX = struct.Struct('<Q')
+SHOWDOWN, BOUNTY_HIT_0, BOUNTY_HIT_1 = 1, 2, 4
+ACTION_NAMES = 'FCKR'
+CARD_INDEX = {card: index for index, card in enumerate(CARDS)}
+RANK_INDEX = {rank: index for index, rank in enumerate(RANKS)}
+
+# hands, board and bounties are in seat order; deltas and bounty_hits are per player
+Round = namedtuple('Round', ['round_num', 'seat0_player', 'hands', 'board', 'bounties', 'street',
+                             'deltas', 'bounty_hits', 'showdown', 'actions'])
+
+
+class HandHistoryWriter():
+    '''
+    Appends rounds to a hand history as they finish.
+
+    Given resume_sizes, the file sizes checkpoint returned, it continues an existing
+    hand history from there instead, dropping any rounds written since.
+    '''
+
+    def __init__(self, name, player_names, resume_sizes=None):
+        if resume_sizes is not None:
+            self.data_file = open(name + '.hh', 'r+b')
+            self.index_file = open(name + '.hhi', 'r+b')
+            for history_file, size in zip((self.data_file, self.index_file), resume_sizes):
+                history_file.truncate(size)
+                history_file.seek(size)
+            self.offset = resume_sizes[0]
+            return
+        self.data_file = open(name + '.hh', 'wb')
+        self.index_file = open(name + '.hhi', 'wb')
+        names = [player_name.encode() for player_name in player_names]
+        self.offset = self.data_file.write(HEADER.pack(MAGIC, VERSION, len(names[0]), len(names[1])) + b''.join(names))
+
+    def write_round(self, round_num, seat0_player, hands, board, bounties, terminal_state, showdown, actions):
+        '''
+        Records one finished round.
+
+        hands, board and bounties are in seat order; actions is a list of
+        (action code, amount) pairs, where the code is an index into ACTION_NAMES.
+        '''
+        flags = SHOWDOWN if showdown else 0
+        if terminal_state.bounty_hits[0]:
+            flags |= BOUNTY_HIT_0
+        if terminal_state.bounty_hits[1]:
+            flags |= BOUNTY_HIT_1
+        record = ROUND.pack(round_num, seat0_player,
+                            bytes(CARD_INDEX[card] for hand in hands for card in hand),
+                            bytes(CARD_INDEX[card] for card in board),
+                            bytes(RANK_INDEX[rank] for rank in bounties),
+                            terminal_state.previous_state.street, terminal_state.deltas[0], flags, len(actions))
+        record += b''.join(ACTION.pack(code, amount) for code, amount in actions)
+        self.index_file.write(INDEX.pack(self.offset))
+        self.offset += self.data_file.write(record)
+
+    def checkpoint(self):
+        '''
+        Forces both files to disk and returns their sizes, to resume from.
+        '''
+        for history_file in (self.data_file, self.index_file):
+            history_file.flush()
+            os.fsync(history_file.fileno())
+        return [self.offset, self.index_file.tell()]
+
+    def close(self):
+        '''
+        Flushes and closes both files.
+        '''
+        self.data_file.close()
+        self.index_file.close()
+
+
+class HandHistory():
+    '''
+    Memory-mapped, read-only access to a hand history.
+    '''
+
+    def __init__(self, name):
+        with open(name + '.hh', 'rb') as data_file:
+            self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(name + '.hhi', 'rb') as index_file:
+            index = index_file.read()
+        # a crash can leave a partial index entry or a partial last round
+        self.offsets = [offset for offset, in INDEX.iter_unpack(index[:len(index) - len(index) % INDEX.size])]
+        while self.offsets and self.offsets[-1] + ROUND.size > len(self.data):
+            self.offsets.pop()
+        magic, version, length0, length1 = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(name + '.hh is not a version {} hand history'.format(VERSION))
+        names_start = HEADER.size + length0
+        self.player_names = [self.data[HEADER.size:names_start].decode(),
+                             self.data[names_start:names_start + length1].decode()]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for round_num in range(1, len(self.offsets) + 1):
+            yield self.round(round_num)
+
+    def close(self):
+        '''
+        Releases the memory map.
+        '''
+        self.data.close()
+
+    def round(self, round_num):
+        '''
+        Decodes one round, counting rounds from 1.
+        '''
+        offset = self.offsets[round_num - 1]
+        (number, seat0_player, hands, board, bounties, street,
+         delta, flags, num_actions) = ROUND.unpack_from(self.data, offset)
+        actions = [(ACTION_NAMES[code], amount) for code, amount in
+                   ACTION.iter_unpack(self.data[offset + ROUND.size:offset + ROUND.size + num_actions * ACTION.size])]
+        deltas = [delta, -delta] if seat0_player == 0 else [-delta, delta]
+        hits = [bool(flags & BOUNTY_HIT_0), bool(flags & BOUNTY_HIT_1)]
+        return Round(number, seat0_player,
+                     [[str(CARDS[index]) for index in hands[:2]], [str(CARDS[index]) for index in hands[2:]]],
+                     [str(CARDS[index]) for index in board], [RANKS[index] for index in bounties], street,
+                     deltas, hits if seat0_player == 0 else hits[::-1], bool(flags & SHOWDOWN), actions)
+
+    def deltas(self):
+        '''
+        Streams each round's deltas per player, without decoding cards or actions.
+        '''
+        for offset in self.offsets:
+            _, seat0_player, _, _, _, _, delta, _, _ = ROUND.unpack_from(self.data, offset)
+            yield (delta, -delta) if seat0_player == 0 else (-delta, delta)
+
+    def bankrolls(self):
+        '''
+        Totals the final bankroll of each player without decoding cards or actions.
+        '''
+        totals = [0, 0]
+        for delta0, delta1 in self.deltas():
+            totals[0] += delta0
+            totals[1] += delta1
+        return list(zip(self.player_names, totals))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python3 hand_history.py NAME')
+        sys.exit(1)
+    history = HandHistory(sys.argv[1])
+    print(len(history), 'rounds')
+    print(history.bankrolls())
+    history.close()
@@ -175,6 +175,12 @@ public class Runner {
                         roundFlag = true;
                         break;
                     }
+                    case 'N': {
+                        // new match on the same connection
+                        gameState = new GameState(0, (float)0., 1);
+                        roundFlag = true;
+                        break;
+                    }
                     case 'Q': {
                         return;
                     }
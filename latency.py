@@ -0,0 +1,117 @@
+'''
+Low-overhead query latency recording for the engine.
+
+Each player keeps one log-bucketed histogram per (street, response) pair, so
+recording a query is a dictionary lookup and a counter increment, plus the
+game clock each player has left at the end of every round.
+'''
+import math
+
+MIN_LATENCY = 1e-6  # seconds; anything faster lands in the first bucket
+BUCKETS_PER_OCTAVE = 8  # bucket bounds grow by 2 ** (1/8), about 9% apart
+NUM_BUCKETS = 30 * BUCKETS_PER_OCTAVE  # up to about 1e-6 * 2 ** 30 seconds = 18 minutes
+STREETS = {0: 'preflop', 3: 'flop', 4: 'turn', 5: 'river'}
+RESPONSES = {'F': 'fold', 'C': 'call', 'K': 'check', 'R': 'raise'}
+
+
+class LatencyHistogram():
+    '''
+    Counts latencies in logarithmic buckets, keeping the exact count, total and maximum.
+    '''
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.
+        self.maximum = 0.
+
+    def add(self, seconds):
+        '''
+        Records one latency.
+        '''
+        if seconds > MIN_LATENCY:
+            self.counts[min(int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_OCTAVE), NUM_BUCKETS - 1)] += 1
+        else:
+            self.counts[0] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def quantile(self, fraction):
+        '''
+        Returns the upper bound of the bucket holding the given quantile, capped by the maximum.
+        '''
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(MIN_LATENCY * 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE), self.maximum)
+        return self.maximum
+
+    def merge(self, other):
+        '''
+        Adds another histogram's counts to this one.
+        '''
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def summary(self):
+        '''
+        Returns the count, mean, p50, p95, p99 and maximum in seconds.
+        '''
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.maximum,
+        }
+
+
+class LatencyRecorder():
+    '''
+    Collects one player's query latencies and end-of-round game clock for a match.
+    '''
+
+    def __init__(self):
+        self.histograms = {}
+        self.clock_left = []
+
+    def record(self, round_state_street, clause, seconds):
+        '''
+        Records the latency of one query.
+
+        round_state_street is the street of the RoundState queried, or None for the
+        end-of-round acknowledgement; clause is the bot's raw response.
+        '''
+        key = (round_state_street, clause[:1])
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def end_round(self, game_clock):
+        '''
+        Records the game clock left after a round.
+        '''
+        self.clock_left.append(game_clock)
+
+    def summary(self):
+        '''
+        Returns latency percentiles per street and response, overall, and the clock left per round.
+        '''
+        overall = LatencyHistogram()
+        streets = {}
+        for (street, response), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0] is None, item[0])):
+            overall.merge(histogram)
+            street_name = 'end of round' if street is None else STREETS.get(street, str(street))
+            response_name = 'ack' if street is None and response == 'K' else RESPONSES.get(response, 'invalid')
+            streets.setdefault(street_name, {})[response_name] = histogram.summary()
+        return {'overall': overall.summary(), 'streets': streets, 'clock_left': self.clock_left}
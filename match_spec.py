@@ -0,0 +1,178 @@
+'''
+Match specs: the players, seed and config.py parameters of one match, given on
+the command line or in a JSON or TOML file, and batch files that expand into a
+whole matrix of matches for tournament.py.
+
+A match spec file holds one object, every key of which is optional:
+
+    {"players": [["A", "./python_skeleton"], ["B", "./pickle_bot"]],
+     "seed": 7,
+     "overrides": {"STARTING_STACK": 200, "BOUNTY_RATIO": 2.0}}
+
+players default to PLAYER_1_NAME/PATH and PLAYER_2_NAME/PATH, seed to GAME_SEED
+(a fresh seed in a tournament), and overrides change any config.py parameter for
+that match only. A batch file holds the same keys, shared by all of its matches,
+and also:
+
+    repeat: matches to play for each combination of the matrix, 1 by default
+    duplicate: play every match twice with the same cards and the seats swapped
+    matrix: lists of values by config.py parameter, or "players" for a list of
+        player pairs; every combination of them is played
+
+so {"repeat": 8, "matrix": {"STARTING_STACK": [200, 400], "BOUNTY_RATIO": [1.5, 3]}}
+plays 8 matches of each of 4 combinations. A seed in a batch file deals the same
+cards in every match of it.
+'''
+import itertools
+import json
+
+import config
+
+try:
+    import tomllib
+except ImportError:  # Python before 3.11
+    tomllib = None
+
+SPEC_KEYS = frozenset(('players', 'seed', 'overrides'))
+BATCH_KEYS = SPEC_KEYS | {'repeat', 'duplicate', 'matrix'}
+
+
+def parse_value(text):
+    '''
+    Parses a config override value as JSON, falling back to a plain string.
+    '''
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_assignments(assignments):
+    '''
+    Parses KEY=VALUE command line arguments into a dict of config overrides.
+    '''
+    overrides = {}
+    for assignment in assignments:
+        key, _, value = assignment.partition('=')
+        overrides[key] = parse_value(value)
+    check_overrides(overrides)
+    return overrides
+
+
+def parse_player(text):
+    '''
+    Parses a NAME=PATH command line argument into a [name, path] pair.
+    '''
+    name, separator, path = text.partition('=')
+    if not separator or not name or not path:
+        raise ValueError('players are given as NAME=PATH, not ' + text)
+    return [name, path]
+
+
+def check_overrides(overrides):
+    '''
+    Raises KeyError for an override that is not a config.py parameter.
+    '''
+    for key in overrides:
+        if not key.isupper() or not hasattr(config, key):
+            raise KeyError('unknown config parameter ' + key)
+
+
+def check_players(players):
+    '''
+    Returns players as two [name, path] pairs, or raises ValueError.
+    '''
+    if (not isinstance(players, list) or len(players) != 2 or
+            any(not isinstance(player, list) or len(player) != 2 for player in players)):
+        raise ValueError('a match needs two [name, path] players, not {!r}'.format(players))
+    return [[str(name), str(path)] for name, path in players]
+
+
+def configured_players(overrides=None):
+    '''
+    Returns the [name, path] pairs of the players config.py names, after overrides.
+    '''
+    overrides = overrides or {}
+    return [[overrides.get('PLAYER_1_NAME', config.PLAYER_1_NAME), overrides.get('PLAYER_1_PATH', config.PLAYER_1_PATH)],
+            [overrides.get('PLAYER_2_NAME', config.PLAYER_2_NAME), overrides.get('PLAYER_2_PATH', config.PLAYER_2_PATH)]]
+
+
+def config_snapshot(namespace):
+    '''
+    Returns the value of every config.py parameter in namespace, a module's globals.
+    '''
+    return {key: namespace[key] for key in vars(config) if key.isupper()}
+
+
+def player_overrides(players):
+    '''
+    Returns the config overrides that make players the configured players.
+    '''
+    (name_1, path_1), (name_2, path_2) = check_players(players)
+    return {'PLAYER_1_NAME': name_1, 'PLAYER_1_PATH': path_1, 'PLAYER_2_NAME': name_2, 'PLAYER_2_PATH': path_2}
+
+
+def load_file(path, keys):
+    '''
+    Reads a JSON file, or a TOML file by its .toml extension, holding one object with only the given keys.
+    '''
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError(path + ': TOML files need Python 3.11 or later, use JSON instead')
+        with open(path, 'rb') as spec_file:
+            data = tomllib.load(spec_file)
+    else:
+        with open(path) as spec_file:
+            data = json.load(spec_file)
+    if not isinstance(data, dict):
+        raise ValueError(path + ' does not hold an object')
+    unknown = set(data) - keys
+    if unknown:
+        raise ValueError('{}: unknown keys {}'.format(path, ', '.join(sorted(unknown))))
+    return data
+
+
+def _match(data):
+    '''
+    Checks the players, seed and overrides of a spec or batch object and returns them as a match dict.
+    '''
+    overrides = dict(data.get('overrides', {}))
+    check_overrides(overrides)
+    players = data.get('players')
+    seed = data.get('seed')
+    if seed is not None and not isinstance(seed, int):
+        raise ValueError('seeds are integers, not {!r}'.format(seed))
+    return {'players': None if players is None else check_players(players), 'seed': seed, 'overrides': overrides}
+
+
+def load_match(path):
+    '''
+    Reads a match spec file into a dict of its players, seed and overrides.
+    players and seed are None where the file leaves them to the config.
+    '''
+    return _match(load_file(path, SPEC_KEYS))
+
+
+def load_batch(path):
+    '''
+    Reads a batch file and returns (matches, duplicate): one match dict, as
+    load_match returns, per match to play, and whether to play them as duplicates.
+    '''
+    data = load_file(path, BATCH_KEYS)
+    base = _match(data)
+    matrix = data.get('matrix', {})
+    for axis, values in matrix.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError('{}: matrix entry {} needs a list of values'.format(path, axis))
+    check_overrides([axis for axis in matrix if axis != 'players'])
+    repeat = data.get('repeat', 1)
+    matches = []
+    for combination in itertools.product(*matrix.values()):
+        match = {'players': base['players'], 'seed': base['seed'], 'overrides': dict(base['overrides'])}
+        for axis, value in zip(matrix, combination):
+            if axis == 'players':
+                match['players'] = check_players(value)
+            else:
+                match['overrides'][axis] = value
+        matches.extend([match] * repeat)
+    return matches, bool(data.get('duplicate', False))
@@ -108,6 +108,11 @@ class Runner():
                     self.pokerbot.handle_round_over(game_state, round_state, active)
                     game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
                     round_flag = True
+                elif clause[0] == 'N':
+                    # new match on the same connection
+                    game_state = GameState(0, 0., 1)
+                    round_state = None
+                    round_flag = True
                 elif clause[0] == 'Q':
                     return
             if round_flag:  # ack the engine
@@ -124,7 +129,9 @@ def parse_args():
     '''
     parser = argparse.ArgumentParser(prog='python3 player.py')
     parser.add_argument('--host', type=str, default='localhost', help='Host to connect to, defaults to localhost')
-    parser.add_argument('port', type=int, help='Port on host to connect to')
+    parser.add_argument('--unix', type=str, default=None, help='Unix domain socket to connect to instead of a port')
+    parser.add_argument('--fd', type=int, default=None, help='Inherited connected socket to use instead of a port')
+    parser.add_argument('port', type=int, nargs='?', help='Port on host to connect to')
     return parser.parse_args()
 
 def run_bot(pokerbot, args):
@@ -133,9 +140,15 @@ def run_bot(pokerbot, args):
     '''
     assert isinstance(pokerbot, Bot)
     try:
-        sock = socket.create_connection((args.host, args.port))
+        if args.fd is not None:
+            sock = socket.socket(fileno=args.fd)
+        elif args.unix is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(args.unix)
+        else:
+            sock = socket.create_connection((args.host, args.port))
     except OSError:
-        print('Could not connect to {}:{}'.format(args.host, args.port))
+        print('Could not connect to {}'.format(args.unix or '{}:{}'.format(args.host, args.port)))
         return
     socketfile = sock.makefile('rw')
     runner = Runner(pokerbot, socketfile)
@@ -0,0 +1,166 @@
+'''
+An indexed SQLite store of match results, kept across runs.
+
+Every match adds one row to matches and one row per round to rounds. The rounds
+are inserted in batches as the match plays, the first batch together with the
+match's row, whose num_rounds stays 0 until the match finishes and its row is
+completed; readers skip such unfinished matches. Player 0 and player 1 are
+the players in the order the match was started with; per-round columns ending
+in _0 or _1 refer to them, and delta and ev_delta are player 0's. Several
+engines may write to one database at once.
+
+usage: python3 results_db.py PATH PLAYER OPPONENT [LAST_MATCHES]
+prints PLAYER's round win rate and mean delta against OPPONENT by PLAYER's bounty rank
+'''
+import sqlite3
+import sys
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    seed TEXT,  -- seeds are unsigned 64-bit, wider than SQLite integers
+    num_rounds INTEGER NOT NULL,
+    player_0 TEXT NOT NULL,
+    player_1 TEXT NOT NULL,
+    path_0 TEXT,
+    path_1 TEXT,
+    bankroll_0 INTEGER NOT NULL,
+    bankroll_1 INTEGER NOT NULL,
+    ev_bankroll_0 REAL,
+    ev_bankroll_1 REAL
+);
+CREATE INDEX IF NOT EXISTS matches_players ON matches (player_0, player_1);
+CREATE INDEX IF NOT EXISTS matches_started ON matches (started);
+CREATE TABLE IF NOT EXISTS rounds (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    round_num INTEGER NOT NULL,
+    seat0_player INTEGER NOT NULL,
+    street INTEGER NOT NULL,
+    delta INTEGER NOT NULL,
+    ev_delta REAL NOT NULL,
+    bounty_0 TEXT NOT NULL,
+    bounty_1 TEXT NOT NULL,
+    bounty_hit_0 INTEGER NOT NULL,
+    bounty_hit_1 INTEGER NOT NULL,
+    showdown INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (match_id, round_num)
+) WITHOUT ROWID;
+'''
+MATCH_COLUMNS = ('name', 'started', 'duration', 'seed', 'num_rounds', 'player_0', 'player_1', 'path_0', 'path_1',
+                 'bankroll_0', 'bankroll_1', 'ev_bankroll_0', 'ev_bankroll_1')
+# the rounds columns after match_id, in the order record_match expects round rows
+ROUND_COLUMNS = ('round_num', 'seat0_player', 'street', 'delta', 'ev_delta', 'bounty_0', 'bounty_1',
+                 'bounty_hit_0', 'bounty_hit_1', 'showdown', 'seconds')
+BUSY_TIMEOUT = 60  # seconds to wait for another writer
+
+
+def connect(path):
+    '''
+    Opens the database at path, creating its tables and indices if needed.
+    '''
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    # concurrent engines can write while others read, and a crash loses at most the last batch
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def insert_match(connection, match):
+    '''
+    Inserts a match's row and returns its id.
+    '''
+    cursor = connection.execute('INSERT INTO matches ({}) VALUES ({})'.format(
+        ', '.join(MATCH_COLUMNS), ', '.join('?' * len(MATCH_COLUMNS))),
+        [match[column] for column in MATCH_COLUMNS])
+    return cursor.lastrowid
+
+
+def insert_rounds(connection, match_id, rounds):
+    '''
+    Inserts round rows of a match, replacing any of the same rounds, which a
+    match resumed from a checkpoint plays again.
+    '''
+    connection.executemany('INSERT OR REPLACE INTO rounds (match_id, {}) VALUES (?, {})'.format(
+        ', '.join(ROUND_COLUMNS), ', '.join('?' * len(ROUND_COLUMNS))),
+        [(match_id,) + row for row in rounds])
+
+
+def record_rounds(path, match, rounds, match_id=None):
+    '''
+    Adds a batch of rounds of an unfinished match to the database at path, in
+    one transaction, with the match's row first if match_id is None.
+
+    match is a dict with the MATCH_COLUMNS as keys, whose num_rounds should be 0;
+    rounds is a list of tuples with the ROUND_COLUMNS in order. Returns the match's id.
+    '''
+    connection = connect(path)
+    try:
+        with connection:
+            if match_id is None:
+                match_id = insert_match(connection, match)
+            insert_rounds(connection, match_id, rounds)
+        return match_id
+    finally:
+        connection.close()
+
+
+def record_match(path, match, rounds, match_id=None):
+    '''
+    Adds a finished match and its last rounds to the database at path, in one
+    transaction, completing the row record_rounds added if match_id is given.
+
+    Arguments are as for record_rounds, with the match's final num_rounds. Returns the match's id.
+    '''
+    connection = connect(path)
+    try:
+        with connection:
+            if match_id is None:
+                match_id = insert_match(connection, match)
+            else:
+                connection.execute('UPDATE matches SET {} WHERE id = ?'.format(
+                    ', '.join(column + ' = ?' for column in MATCH_COLUMNS)),
+                    [match[column] for column in MATCH_COLUMNS] + [match_id])
+            insert_rounds(connection, match_id, rounds)
+        return match_id
+    finally:
+        connection.close()
+
+
+def bounty_win_rates(path, player, opponent, last_matches=10000):
+    '''
+    Returns (bounty rank, rounds, round win rate, mean delta) rows for player
+    against opponent over their last_matches most recent matches, by player's bounty rank.
+    '''
+    connection = connect(path)
+    try:
+        return connection.execute('''
+            WITH recent AS (
+                SELECT id, player_0 = :player AS first FROM matches
+                WHERE num_rounds > 0 AND ((player_0 = :player AND player_1 = :opponent)
+                                          OR (player_0 = :opponent AND player_1 = :player))
+                ORDER BY started DESC LIMIT :last_matches
+            ), player_rounds AS (
+                SELECT CASE WHEN first THEN bounty_0 ELSE bounty_1 END AS bounty,
+                       CASE WHEN first THEN delta ELSE -delta END AS delta
+                FROM recent JOIN rounds ON rounds.match_id = recent.id
+            )
+            SELECT bounty, COUNT(*), AVG(delta > 0), AVG(delta) FROM player_rounds
+            GROUP BY bounty ORDER BY instr('23456789TJQKA', bounty)
+            ''', {'player': player, 'opponent': opponent, 'last_matches': last_matches}).fetchall()
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5):
+        print('usage: python3 results_db.py PATH PLAYER OPPONENT [LAST_MATCHES]')
+        sys.exit(1)
+    last_matches = int(sys.argv[4]) if len(sys.argv) == 5 else 10000
+    print('bounty  rounds  win rate  mean delta')
+    for bounty, count, win_rate, mean_delta in bounty_win_rates(sys.argv[1], sys.argv[2], sys.argv[3], last_matches):
+        print('{:>6}  {:>6}  {:>8.3f}  {:>10.2f}'.format(bounty, count, win_rate, mean_delta))
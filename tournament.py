@@ -0,0 +1,358 @@
+'''
+Runs many engine matches at once in a process pool.
+
+Every match runs in its own working directory, so its game log and player
+logs never collide with another match, and gets its own config overrides.
+The per-match results are collected into one summary.
+'''
+from contextlib import redirect_stdout
+from queue import Queue
+import multiprocessing
+import argparse
+import random
+import math
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+from match_spec import check_overrides, configured_players, load_batch, parse_assignments
+import engine
+
+
+def make_match(match_id, players=None, overrides=None, seed=None):
+    '''
+    Builds a match spec.
+
+    Arguments:
+    match_id: a name for the match, also used as its working directory.
+    players: a list of (name, path) pairs, defaults to the PLAYER_1 and PLAYER_2
+        of the config, after overrides.
+    overrides: a dict of config.py parameters to change for this match only.
+    seed: seeds the cards and bounties, defaults to a fresh random seed.
+    '''
+    return {
+        'match_id': str(match_id),
+        'players': [list(player) for player in (players or configured_players(overrides))],
+        'overrides': dict(overrides or {}),
+        'seed': random.getrandbits(64) if seed is None else seed,
+        'pair': None,
+    }
+
+
+def make_duplicate(match_id, players=None, overrides=None, seed=None):
+    '''
+    Builds the two halves of a duplicate match.
+
+    Both halves share one seed, so they deal the same cards and bounties round
+    for round, but the second half seats the players in reverse. Whatever one bot
+    was dealt in the first half, the other bot is dealt in the second half.
+    '''
+    first = make_match(str(match_id) + '_a', players, overrides, seed)
+    second = make_match(str(match_id) + '_b', first['players'][::-1], overrides, first['seed'])
+    first['pair'] = second['pair'] = str(match_id)
+    return [first, second]
+
+
+def apply_overrides(overrides):
+    '''
+    Replaces config parameters in the engine module, which star-imports config.
+    '''
+    check_overrides(overrides)
+    for key, value in overrides.items():
+        setattr(engine, key, value)
+
+
+def _new_players(spec):
+    '''
+    Creates the engine players of a match spec.
+    '''
+    player_class = engine.InProcessPlayer if engine.IN_PROCESS_BOTS else engine.Player
+    return [player_class(name, os.path.join(ROOT, path)) for name, path in spec['players']]
+
+
+def _parse_cpu_list(text):
+    '''
+    Parses a Linux CPU list such as 0-3,8 into a list of CPU numbers.
+    '''
+    cpus = []
+    for part in text.strip().split(','):
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def core_slots(cores_per_match):
+    '''
+    Splits the cores this process may run on into sets of cores_per_match, one per
+    match that can run at once. Hyperthreads of one physical core go in the same
+    set where they fit, so that a match on a core pair owns a whole core.
+    '''
+    cores = sorted(os.sched_getaffinity(0))
+    ordered = []
+    for core in cores:
+        if core in ordered:
+            continue
+        try:
+            with open('/sys/devices/system/cpu/cpu{}/topology/thread_siblings_list'.format(core)) as siblings_file:
+                siblings = _parse_cpu_list(siblings_file.read())
+        except OSError:
+            siblings = [core]
+        ordered.extend(sibling for sibling in siblings if sibling in cores and sibling not in ordered)
+    return [ordered[i:i + cores_per_match] for i in range(0, len(ordered) - cores_per_match + 1, cores_per_match)]
+
+
+def run_batch(specs, output_dir, cores=None):
+    '''
+    Plays matches that share players and overrides one after another, keeping the
+    bots warm between them, each inside output_dir/match_id. Returns their result dicts.
+
+    Meant to run in a pool worker that is not reused, since the config
+    overrides and the working directory are process-wide. With cores, the worker
+    and so the engine and the bots it starts run on those cores only.
+    '''
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    random.seed()  # forked workers would otherwise share the parent's RNG state
+    results = []
+    players = None
+    for i, spec in enumerate(specs):
+        workdir = os.path.join(output_dir, spec['match_id'])
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        result = {'match_id': spec['match_id'], 'workdir': workdir, 'overrides': spec['overrides'],
+                  'seed': spec['seed'], 'pair': spec['pair'], 'bankrolls': None, 'ev_bankrolls': None,
+                  'timings': None, 'resources': None, 'error': None}
+        start_time = time.perf_counter()
+        with open('engine.txt', 'w') as engine_output, redirect_stdout(engine_output):
+            try:
+                if players is None:
+                    apply_overrides(spec['overrides'])
+                    players = _new_players(spec)
+                game = engine.Game(spec['seed'], match_id=spec['match_id'])
+                result['bankrolls'] = game.run(players, keep_alive=i < len(specs) - 1)
+                result['ev_bankrolls'] = game.ev_bankrolls
+                result['timings'] = game.timings
+                result['resources'] = game.resources
+            except Exception as error:  # pylint: disable=broad-except
+                result['error'] = repr(error)
+                # do not reuse bots in an unknown state
+                for player in players or []:
+                    player.stop()
+                players = None
+        result['duration'] = time.perf_counter() - start_time
+        results.append(result)
+    return results
+
+
+def run_match(spec, output_dir):
+    '''
+    Plays one match inside output_dir/match_id and returns its result dict.
+    '''
+    return run_batch([spec], output_dir)[0]
+
+
+def make_batches(matches, batch_size):
+    '''
+    Groups match specs with the same players and overrides into batches of at most batch_size.
+    '''
+    groups = {}
+    for spec in matches:
+        key = json.dumps([spec['players'], spec['overrides']], sort_keys=True)
+        groups.setdefault(key, []).append(spec)
+    return [group[i:i + batch_size] for group in groups.values() for i in range(0, len(group), batch_size)]
+
+
+def summarize(results):
+    '''
+    Totals bankrolls, wins and losses per player name over all finished matches,
+    and the game clock, CPU seconds and involuntary context switches of bots
+    whose resources were sampled, with their highest peak memory.
+    '''
+    players = {}
+    for result in results:
+        if result['bankrolls'] is None:
+            continue
+        for seat, (name, bankroll) in enumerate(result['bankrolls']):
+            totals = players.setdefault(name, {'matches': 0, 'wins': 0, 'losses': 0, 'bankroll': 0})
+            totals['matches'] += 1
+            totals['bankroll'] += bankroll
+            opponent = result['bankrolls'][1 - seat][1]
+            if bankroll > opponent:
+                totals['wins'] += 1
+            elif bankroll < opponent:
+                totals['losses'] += 1
+            resources = (result.get('resources') or {}).get(name)
+            if resources is not None:
+                totals['clock_used'] = totals.get('clock_used', 0.) + resources['clock_used']
+                totals['cpu_seconds'] = totals.get('cpu_seconds', 0.) + resources['cpu_seconds']
+                totals['involuntary_switches'] = totals.get('involuntary_switches', 0) + resources['involuntary_switches']
+                totals['peak_rss'] = max(totals.get('peak_rss', 0), resources['peak_rss'])
+    return {
+        'matches': len(results),
+        'failed': [result['match_id'] for result in results if result['error'] is not None],
+        'players': players,
+        'duplicate': summarize_pairs(results),
+    }
+
+
+def summarize_pairs(results):
+    '''
+    Reports the paired delta of every duplicate match whose halves both finished.
+
+    A player's paired delta is the sum of its bankrolls over both halves, which
+    cancels the card luck the two halves share. Returns the mean and standard
+    error of the paired deltas per player name.
+    '''
+    halves = {}
+    for result in results:
+        if result['pair'] is not None and result['bankrolls'] is not None:
+            halves.setdefault(result['pair'], []).append(result['bankrolls'])
+    deltas = {}
+    for pair in halves.values():
+        if len(pair) != 2:
+            continue
+        totals = {}
+        for bankrolls in pair:
+            for name, bankroll in bankrolls:
+                totals[name] = totals.get(name, 0) + bankroll
+        for name, total in totals.items():
+            deltas.setdefault(name, []).append(total)
+    report = {}
+    for name, values in deltas.items():
+        mean = sum(values) / len(values)
+        variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1) if len(values) > 1 else 0.
+        report[name] = {'pairs': len(values), 'mean': mean, 'stderr': math.sqrt(variance / len(values))}
+    return report
+
+
+def run_tournament(matches, output_dir='tournament', processes=None, callback=None, batch_size=1, stop=None,
+                   cores_per_match=None):
+    '''
+    Runs every match spec in a process pool and returns (results, summary).
+
+    processes defaults to the number of cores. With a batch_size above 1, up to that
+    many matches with the same players and overrides are played by one worker with
+    warm bots, so bot startup is paid once per batch. callback, if given, is called
+    with each result as soon as its batch finishes. stop, if given, is called after
+    each batch's callbacks; once it returns True no further batches are started,
+    and the ones already running are finished. The summary and the results are
+    also written to output_dir/summary.json.
+
+    With cores_per_match, every running match, its engine and both bots, is pinned
+    to its own set of that many cores, and no more matches run at once than there
+    are such sets, so game clocks are charged the same however many matches run.
+    '''
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    slots = None
+    if cores_per_match is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            slots = core_slots(cores_per_match)
+            if not slots:
+                raise ValueError('only {} cores to pin matches with {} cores each'.format(
+                    len(os.sched_getaffinity(0)), cores_per_match))
+            processes = min(processes or len(slots), len(slots))
+        else:
+            print('Pinning matches to cores needs Linux, running them unpinned')
+    processes = processes or os.cpu_count()
+    free_slots = list(range(len(slots))) if slots is not None else None
+    results = []
+    batches = iter(make_batches(matches, batch_size))
+    finished = Queue()
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        # batches are started one at a time as workers free up, rather than all queued
+        # at once, so that stop can cut the tournament short
+        def start_batch():
+            batch = next(batches, None)
+            if batch is not None:
+                slot = None if free_slots is None else free_slots.pop()
+                done = lambda batch_results: finished.put((slot, batch_results))
+                pool.apply_async(run_batch, (batch, output_dir, None if slot is None else slots[slot]),
+                                 callback=done, error_callback=done)
+            return batch is not None
+        running = sum(start_batch() for _ in range(processes))
+        while running:
+            slot, batch_results = finished.get()
+            running -= 1
+            if slot is not None:
+                free_slots.append(slot)
+            if isinstance(batch_results, BaseException):
+                raise batch_results
+            for result in batch_results:
+                results.append(result)
+                if callback is not None:
+                    callback(result)
+            if (stop is None or not stop()) and start_batch():
+                running += 1
+    results.sort(key=lambda result: result['match_id'])
+    summary = summarize(results)
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as summary_file:
+        json.dump({'summary': summary, 'results': results}, summary_file, indent=4)
+    return results, summary
+
+
+def parse_args():
+    '''
+    Parses tournament command line arguments.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 tournament.py')
+    parser.add_argument('--matches', type=int, default=os.cpu_count(), help='Number of matches to play')
+    parser.add_argument('--processes', type=int, default=None, help='Matches run at once, defaults to the core count')
+    parser.add_argument('--output', type=str, default='tournament', help='Directory for per-match working directories')
+    parser.add_argument('--duplicate', action='store_true',
+                        help='Play every match twice with the same cards and the seats swapped')
+    parser.add_argument('--warm', type=int, default=1, metavar='N',
+                        help='Play up to N matches per bot launch, resetting bankrolls and clocks in between;'
+                             ' bots without "warm": true in commands.json are restarted for each match')
+    parser.add_argument('--pin', type=int, default=None, metavar='CORES',
+                        help='Pin every match, its engine and bots, to its own CORES cores, running'
+                             ' at most as many matches at once as there are such sets (Linux only)')
+    parser.add_argument('--db', type=str, default=None, metavar='PATH',
+                        help='Add every match and its rounds to this SQLite database')
+    parser.add_argument('--feed', type=str, default=None, metavar='PATH',
+                        help='Send live events of every match to this Unix datagram socket or FIFO; see event_feed.py')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override a config.py parameter for every match')
+    parser.add_argument('--batch', type=str, default=None, metavar='FILE',
+                        help='Play the matrix of matches a JSON or TOML batch file defines, instead of --matches'
+                             ' matches; see match_spec.py')
+    return parser.parse_args()
+
+
+def batch_specs(path, overrides, duplicate=False):
+    '''
+    Builds the match specs of a batch file, with overrides applied on top of each match's own.
+    '''
+    matches, batch_duplicate = load_batch(path)
+    specs = []
+    for i, match in enumerate(matches):
+        match_id = 'match_{:05d}'.format(i)
+        match_overrides = dict(match['overrides'], **overrides)
+        if duplicate or batch_duplicate:
+            specs.extend(make_duplicate(match_id, match['players'], match_overrides, match['seed']))
+        else:
+            specs.append(make_match(match_id, match['players'], match_overrides, match['seed']))
+    return specs
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    overrides = parse_assignments(args.set)
+    if args.db is not None:
+        # matches run in their own working directories
+        overrides['RESULTS_DATABASE'] = os.path.abspath(args.db)
+    if args.feed is not None:
+        overrides['EVENT_FEED'] = os.path.abspath(args.feed)
+    if args.batch is not None:
+        specs = batch_specs(args.batch, overrides, args.duplicate)
+    elif args.duplicate:
+        specs = [spec for i in range(args.matches) for spec in make_duplicate('match_{:05d}'.format(i), overrides=overrides)]
+    else:
+        specs = [make_match('match_{:05d}'.format(i), overrides=overrides) for i in range(args.matches)]
+    _, summary = run_tournament(specs, args.output, args.processes,
+                                callback=lambda result: print(result['match_id'], result['bankrolls'] or result['error']),
+                                batch_size=args.warm, cores_per_match=args.pin)
+    print(json.dumps(summary, indent=4))